@@ -1,6 +1,9 @@
 import os
 import time
+import concurrent.futures
+from threading import Lock
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
 from google.api_core import exceptions as api_exceptions
 from dotenv import load_dotenv
 
@@ -12,12 +15,18 @@ API_KEY = os.getenv("GEMINI_API_KEY")
 api_keys_raw = os.getenv("GEMINI_API_KEYS", API_KEY)
 API_KEYS = [k.strip() for k in api_keys_raw.split(',') if k.strip()]
 
+print_lock = Lock()  # keeps each key's report on one line while tests run in parallel
+
+def report(index, message):
+    with print_lock:
+        print(f"Testing API key {index+1}... {message}", flush=True)
+
 def check_key(api_key, index):
     """Test if an API key is valid by sending a simple request"""
     try:
-        print(f"Testing API key {index+1}...", end="", flush=True)
-        genai.configure(api_key=api_key)
+        # genai.configure() is process-global, so give this model its own client bound to the key
         model = genai.GenerativeModel("gemini-1.5-flash")
+        model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
         
         # Send a minimal request to test the key
         start_time = time.time()
@@ -26,33 +35,31 @@ def check_key(api_key, index):
         
         # Check if we got a valid response
         if response and hasattr(response, 'text'):
-            print(f" ✅ Valid! (Response time: {elapsed:.2f}s)")
+            report(index, f"✅ Valid! (Response time: {elapsed:.2f}s)")
             return True
         else:
-            print(f" ❌ Invalid (No response text)")
+            report(index, "❌ Invalid (No response text)")
             return False
     except api_exceptions.InvalidArgument:
-        print(f" ❌ Invalid API key format")
+        report(index, "❌ Invalid API key format")
         return False
     except api_exceptions.PermissionDenied:
-        print(f" ❌ API key doesn't have permission")
+        report(index, "❌ API key doesn't have permission")
         return False
     except api_exceptions.ResourceExhausted:
-        print(f" ⚠️ Rate limited (key might be valid but exceeded quota)")
+        report(index, "⚠️ Rate limited (key might be valid but exceeded quota)")
         return True  # Consider rate-limited keys as valid
     except Exception as e:
-        print(f" ❌ Error: {str(e)}")
+        report(index, f"❌ Error: {str(e)}")
         return False
 
 def main():
     print(f"Found {len(API_KEYS)} API key(s) to test")
     
-    valid_keys = 0
-    for i, key in enumerate(API_KEYS):
-        if check_key(key, i):
-            valid_keys += 1
-        # Brief pause between tests to avoid rate limiting
-        time.sleep(1)
+    # Keys don't share a quota, so test them all at once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(16, len(API_KEYS)))) as pool:
+        results = list(pool.map(lambda ik: check_key(ik[1], ik[0]), enumerate(API_KEYS)))
+    valid_keys = sum(results)
     
     print("\nSummary:")
     print(f"- Total keys tested: {len(API_KEYS)}")
@@ -67,10 +74,12 @@ def main():
         print("\n✅ All API keys are valid!")
     
     print("\nRecommended configuration in .env file:")
-    print(f"MAX_WORKERS={min(valid_keys, 4)}")
-    print(f"QUOTA_PER_MINUTE={valid_keys * 15}")
+    # Workers are coroutines sharing every key, so concurrency can grow with the key count;
+    # QUOTA_PER_MINUTE is a per-key budget and does not
+    print(f"MAX_WORKERS={max(4, valid_keys * 2)}")
+    print("QUOTA_PER_MINUTE=15  # per key")
     
     return 0
 
 if __name__ == "__main__":
-    exit(main()) 
\ No newline at end of file
+    exit(main()) 
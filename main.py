@@ -1,7 +1,12 @@
-import os, re, json, time
+import os, csv, json, time, atexit, asyncio, contextlib, hashlib, sqlite3, threading, datetime, logging
+from collections import deque
+import httpx
+import orjson
 import pandas as pd
 import google.generativeai as genai
 from google.generativeai import types
+from google import genai as google_genai
+from google.genai import types as google_types
 from google.api_core import exceptions as api_exceptions
 from dotenv import load_dotenv
 
@@ -10,6 +15,9 @@ load_dotenv()  # Load .env file
 
 # ─── Configuration ────────────────────────────────────────────────────────────
 API_KEY = os.getenv("GEMINI_API_KEY")
+# Clean and process API keys from environment variable
+api_keys_raw = os.getenv("GEMINI_API_KEYS", API_KEY) or ""
+API_KEYS = [k.strip() for k in api_keys_raw.split(',') if k.strip()]  # Strip whitespace and filter empty
 MODEL = os.getenv("MODEL", "gemini-2.0-flash")
 
 EXISTING_FILE = os.getenv("EXISTING_FILE", "existing_mapping.csv")
@@ -19,8 +27,18 @@ CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "checkpoint_processed.txt")
 ERROR_FILE = os.getenv("ERROR_FILE", "errors_unprocessed.txt")
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
-BATCH_SIZE = int(os.getenv("BATCH_SIZE", "15"))
-PAUSE_SECONDS = int(os.getenv("PAUSE_SECONDS", "60"))
+BATCH_INPUT_FILE = os.getenv("BATCH_INPUT_FILE", "batch_input.jsonl")
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "30"))
+CACHE_FILE = os.getenv("CACHE_FILE", "gemini_cache.sqlite")  # Parsed results of previous calls
+COMPANIES_PER_PROMPT = max(1, int(os.getenv("COMPANIES_PER_PROMPT", "5")))  # Companies classified per model call
+
+# "batch" → Gemini Batch Mode (cheapest); "online" → concurrent real-time calls over all API keys
+RUN_MODE = os.getenv("RUN_MODE", "batch")
+PER_KEY_RPM = int(os.getenv("PER_KEY_RPM", "15"))  # Requests per minute allowed on each key
+PER_KEY_TPM = int(os.getenv("PER_KEY_TPM", "1000000"))  # Tokens per minute allowed on each key
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Logging level for status, retry and error messages
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "7200"))  # Seconds the static prompt stays cached; 0 disables
+TARGET_LATENCY = float(os.getenv("TARGET_LATENCY", "20"))  # Seconds; slower calls shrink concurrency (online mode)
 
 CATEGORIES = [
     "Content","Customer Service","Cyber Security","Data","DefTech","Dev Tools",
@@ -29,11 +47,73 @@ CATEGORIES = [
     "SalesTech","Science","HRTech","Consumer/Social"
 ]
 
+# JSON-mode response schema; the API guarantees parseable output matching it
+CLASSIFY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "is_startup": {"type": "BOOLEAN"},
+        "is_startup_confidence": {"type": "INTEGER"},
+        "startup_rationale": {"type": "STRING"},
+        "is_gen_ai_startup": {"type": "BOOLEAN"},
+        "is_gen_ai_startup_confidence": {"type": "INTEGER"},
+        "gen_ai_rationale": {"type": "STRING"},
+        "layer": {"type": "STRING", "nullable": True},
+        "layer_confidence": {"type": "INTEGER"},
+        "category": {"type": "STRING", "nullable": True},
+        "category_confidence": {"type": "INTEGER"},
+        "is_linked_to_france": {"type": "BOOLEAN"},
+        "is_linked_to_france_confidence": {"type": "INTEGER"},
+    },
+    "required": [
+        "is_startup", "is_startup_confidence", "startup_rationale",
+        "is_gen_ai_startup", "is_gen_ai_startup_confidence", "gen_ai_rationale",
+        "layer", "layer_confidence", "category", "category_confidence",
+        "is_linked_to_france", "is_linked_to_france_confidence",
+    ],
+}
+
+GENERATION_CONFIG = {
+    "temperature": 0.05,  # Very low temperature for more consistent formatting and reasoning
+    "candidate_count": 1,
+    "max_output_tokens": 512,  # the JSON answer is ~200 tokens; the schema keeps it from rambling
+    "response_mime_type": "application/json",
+    "response_schema": CLASSIFY_SCHEMA,
+}
+# Several companies per call: an array of classifications, each echoing the "key" it was given
+GROUP_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"key": {"type": "STRING"}, **CLASSIFY_SCHEMA["properties"]},
+        "required": ["key", *CLASSIFY_SCHEMA["required"]],
+    },
+}
+
+def generation_config_for(count: int) -> dict:
+    """GENERATION_CONFIG for a prompt holding `count` companies (output budget grows with the group)."""
+    if count == 1:
+        return GENERATION_CONFIG
+    return {
+        **GENERATION_CONFIG,
+        # 8192 is the output ceiling of the gemini-2.x flash models
+        "max_output_tokens": min(8192, GENERATION_CONFIG["max_output_tokens"] * count),
+        "response_schema": GROUP_SCHEMA,
+    }
+
+# Built once for the SDK fallback path; the REST and batch paths send the dict as-is
+GEN_CONFIG = genai.types.GenerationConfig(**GENERATION_CONFIG)
+
+logger = logging.getLogger(__name__)
+
 # ─── Gemini client & search tool ──────────────────────────────────────────────
 genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel(MODEL)
 
-# ─── Prompt template (unchanged, brace-safe) ─────────────────────────────────
+# Batch Mode lives in the google-genai SDK (google.generativeai has no batch API)
+BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+}
+
+# ─── Prompt template (brace-safe) ────────────────────────────────────────────
 PROMPT_TEMPLATE = """
 You are a specialized AI trained to classify French startups leveraging Generative AI. Your task is to analyze companies and output structured data about them.
 
@@ -41,8 +121,8 @@ IMPORTANT: Take a step-by-step approach in your analysis. First, thoroughly rese
 
 ╭────────────────────────  TASK  ────────────────────────╮
 │  Step 1. THINK through your analysis carefully.        │
-│  Step 2. Show detailed reasoning with evidence.        │
-│  Step 3. Output JSON between <JSON>…</JSON> tags.      │
+│  Step 2. Condense the evidence into the rationales.    │
+│  Step 3. Output a single JSON object, nothing else.    │
 ╰────────────────────────────────────────────────────────╯
 
 ────────────────────────  CONTEXT  ───────────────────────
@@ -63,7 +143,7 @@ France has a growing Gen-AI ecosystem with hubs in Paris, Lyon, and other major
   - Application: Uses Gen-AI to solve specific problems for end-users (most common category)
 
 • **Category** – Choose the most appropriate:
-  {Content, Customer Service, Cyber Security, Data, DefTech, Dev Tools, Development, EdTech, Enterprise Platforms, Gaming, HealthTech, Knowledge Workers, LegalTech, Marketing, Note Taker, RFP, Safety, SalesTech, Science, HRTech, Consumer/Social}
+  {{Content, Customer Service, Cyber Security, Data, DefTech, Dev Tools, Development, EdTech, Enterprise Platforms, Gaming, HealthTech, Knowledge Workers, LegalTech, Marketing, Note Taker, RFP, Safety, SalesTech, Science, HRTech, Consumer/Social}}
 
 • **France link** – HQ in France, majority of team in France, or founders clearly French. Look for location information, team background, language of website, etc.
 
@@ -106,15 +186,10 @@ For each company, follow these steps in your analysis:
 • Companies with minimal online presence: Use available information to make best judgment, but lean toward lower confidence scores.
 
 ────────────────────────  FORMAT  ───────────────────────
-### REASONING
-*Startup evidence*: 2-3 detailed bullet points with specific evidence.  
-*Gen-AI evidence*: 2-3 detailed bullet points with specific technologies and applications.  
-*Layer reasoning*: 1-2 bullet points explaining why this layer classification fits.  
-*Category reasoning*: 1-2 bullet points explaining the category choice.  
-*France evidence*: 1-2 bullet points about French connections.  
-
-### RESULT
-<JSON>
+Reply with exactly one JSON object. The rationale fields carry your reasoning:
+*startup_rationale*: the specific startup evidence.  
+*gen_ai_rationale*: the specific Gen-AI technologies and applications.  
+
 {{  "is_startup": …,
     "is_startup_confidence": …,
     "startup_rationale": "...",
@@ -127,13 +202,11 @@ For each company, follow these steps in your analysis:
     "category_confidence": …,
     "is_linked_to_france": …,
     "is_linked_to_france_confidence": … }}
-</JSON>
 
 Rules:  
 • Confidence ≥ 60 only if boolean is true.  
 • If information is truly insufficient → booleans false, layer/category null.  
 • Favour *false* over *true* when evidence is weak; reserve *null* only for no info.
-• ALWAYS wrap the JSON between <JSON> and </JSON> tags.
 • ALWAYS use double quotes for JSON strings.
 • NEVER include trailing commas in JSON.
 
@@ -141,8 +214,7 @@ Rules:
 Input:
 Name: Iktos
 Website: https://iktos.ai/
-Output:
-### REASONING
+Evidence considered:
 *Startup evidence*: 
 - Company has a SaaS product page with detailed offerings for molecule design
 - Press releases mention Series A funding round, indicating venture backing
@@ -163,8 +235,7 @@ Output:
 - Headquarters listed as Paris, France
 - Founding team includes French researchers
 
-### RESULT
-<JSON>
+Output:
 {{"is_startup": true, "is_startup_confidence": 95,
   "startup_rationale":"SaaS product with Series A funding",
   "is_gen_ai_startup": true, "is_gen_ai_startup_confidence": 90,
@@ -172,14 +243,12 @@ Output:
   "layer":"Application","layer_confidence":85,
   "category":"Science","category_confidence":88,
   "is_linked_to_france": true,"is_linked_to_france_confidence":80}}
-</JSON>
 
 ────────────────────────  NEGATIVE EXAMPLE  ──────────────
 Input:
 Name: A Kind of Magic
 Website: https://www.akindofmagic.ai/
-Output:
-### REASONING
+Evidence considered:
 *Startup evidence*: 
 - Only offers a newsletter about AI trends, no actual product identified
 - No information about funding, team size, or company structure
@@ -200,8 +269,7 @@ Output:
 - No clear connection to France in available information
 - Website and content appear to be in English with no French location mentioned
 
-### RESULT
-<JSON>
+Output:
 {{"is_startup": false,"is_startup_confidence":94,
   "startup_rationale":"Newsletter only, no product offering",
   "is_gen_ai_startup": false,"is_gen_ai_startup_confidence":92,
@@ -209,240 +277,703 @@ Output:
   "layer": null,"layer_confidence":0,
   "category": null,"category_confidence":0,
   "is_linked_to_france": false,"is_linked_to_france_confidence":70}}
-</JSON>
 
 ────────────────────────  CLASSIFY  ───────────────────────
 Name: {name}
 Description (ID-check only – do NOT rely on it): {description}
 
-Remember: Take your time to analyze thoroughly, provide detailed reasoning, and ALWAYS wrap your JSON response in <JSON> tags.
+Remember: Take your time to analyze thoroughly and put your key evidence into the rationale fields.
 """
 
-# ─── Helper: classify with retries ────────────────────────────────────────────
+# Everything above the CLASSIFY block is identical for every company and can live in a context cache
+CLASSIFY_MARKER = "────────────────────────  CLASSIFY  ───────────────────────"
+_static_part, _, _classify_tail = PROMPT_TEMPLATE.partition(CLASSIFY_MARKER)
+PROMPT_STATIC = _static_part.format()  # no placeholders up there: just un-escapes {{ }} once
+PROMPT_CLASSIFY = CLASSIFY_MARKER + _classify_tail
+
+# Same CLASSIFY block for a group of companies, answered as one JSON array
+PROMPT_CLASSIFY_GROUP = CLASSIFY_MARKER + """
+Classify each of the {count} companies below independently. Instead of a single object, reply with a
+JSON array holding one object per company, each with the "key" shown for that company plus every field above.
+
+{companies}
+Remember: Take your time to analyze thoroughly and put your key evidence into the rationale fields.
+"""
+PROMPT_GROUP_ENTRY = """[key {key}]
+Name: {name}
+Description (ID-check only – do NOT rely on it): {description}
+"""
+
+# ─── Helper: prompt & JSON extraction ─────────────────────────────────────────
+def build_prompt(name: str, description: str) -> str:
+    """
+    Full prompt sent to the model for a single company: PROMPT_TEMPLATE with its
+    {name} / {description} placeholders filled. Only the short CLASSIFY tail is formatted.
+    """
+    return PROMPT_STATIC + build_user_turn(name, description)
+
+
+def build_user_turn(name: str, description: str) -> str:
+    """Per-company part of the prompt, for models holding PROMPT_STATIC in a context cache."""
+    return PROMPT_CLASSIFY.format(name=name, description=description)
+
+
+def build_group_user_turn(rows: list[tuple[str, str]]) -> str:
+    """
+    Per-call part of the prompt for `rows`: the usual single-company block for one row,
+    otherwise one numbered entry per company (keys "1".."N", echoed back by the model).
+    """
+    if len(rows) == 1:
+        return build_user_turn(*rows[0])
+    companies = "\n".join(
+        PROMPT_GROUP_ENTRY.format(key=i, name=name, description=desc) for i, (name, desc) in enumerate(rows, 1)
+    )
+    return PROMPT_CLASSIFY_GROUP.format(count=len(rows), companies=companies)
+
+
+def prompt_for(key_model: genai.GenerativeModel, user_turn: str) -> str:
+    """`user_turn` alone when `key_model` holds PROMPT_STATIC in a context cache, else the full prompt."""
+    return user_turn if key_model.cached_content else PROMPT_STATIC + user_turn
+
+
+def chunked(rows: list, size: int = COMPANIES_PER_PROMPT) -> list[list]:
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def parse_classification(raw: str, decode=orjson.loads) -> dict:
+    """
+    Decode a JSON-mode response (or any text `decode` turns into JSON). Raises ValueError
+    (orjson.JSONDecodeError is one) when the model returned something other than a JSON object.
+    """
+    result = decode(raw)
+    if not isinstance(result, dict):
+        raise ValueError(f"Expected a JSON object, got {type(result).__name__}")
+    return result
+
+
+def parse_group(raw: str, rows: list[tuple[str, str]], decode=orjson.loads) -> dict[str, dict]:
+    """
+    Decode the answer to build_group_user_turn(rows) into {company_name: classification}.
+    Companies the model skipped (or keyed wrongly) are simply missing from the result;
+    ValueError when the response is not a JSON array at all. `decode` turns the response
+    text into JSON: the JSON-mode body here, a tagged block for the grounded prompts.
+    """
+    if len(rows) == 1:
+        return {rows[0][0]: parse_classification(raw, decode)}
+    items = decode(raw)
+    if not isinstance(items, list):
+        raise ValueError(f"Expected a JSON array, got {type(items).__name__}")
+    names = {str(i): name for i, (name, _) in enumerate(rows, 1)}
+    results = {}
+    for item in items:
+        if isinstance(item, dict) and str(item.get("key")) in names:
+            results[names[str(item.pop("key"))]] = item
+    return results
+
+
+def group_raw_items(raw: str, rows: list[tuple[str, str]]) -> dict[str, str]:
+    """
+    Each company's own part of the answer to build_group_user_turn(rows), as JSON text: the raw
+    response ResultCache keeps for it, which parse_classification can re-read on its own.
+    """
+    if len(rows) == 1:
+        return {rows[0][0]: raw}
+    names = {str(i): name for i, (name, _) in enumerate(rows, 1)}
+    return {
+        names[str(item["key"])]: orjson.dumps(item).decode()
+        for item in orjson.loads(raw)
+        if isinstance(item, dict) and str(item.get("key")) in names
+    }
+
+
+# ─── Result cache ────────────────────────────────────────────────────────────
+class ResultCache:
+    """
+    Parsed classifications keyed by sha256(MODEL|name|description), so re-runs and
+    duplicate rows never pay for the same model call twice. The raw response text can be
+    kept alongside (for a group answer, the company's own item - see group_raw_items), so a
+    better parser can re-read old answers with parse_classification without calling the API.
+    """
+
+    def __init__(self, path: str = CACHE_FILE):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, result BLOB)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS raw (key BLOB PRIMARY KEY, text TEXT)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, description: str) -> bytes:
+        return hashlib.sha256(f"{MODEL}|{name}|{description}".encode("utf-8")).digest()
+
+    def get(self, name: str, description: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM cache WHERE key=?", (self.key(name, description),)
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def get_raw(self, name: str, description: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM raw WHERE key=?", (self.key(name, description),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, name: str, description: str, result: dict, raw: str | None = None) -> None:
+        key = self.key(name, description)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, result) VALUES (?, ?)", (key, orjson.dumps(result))
+            )
+            if raw is not None:
+                self._conn.execute("INSERT OR REPLACE INTO raw (key, text) VALUES (?, ?)", (key, raw))
+            self._conn.commit()
+
+
+_result_cache = None
+
+def result_cache() -> ResultCache:
+    """Process-wide cache, opened on first use."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+def split_cached(rows: list[tuple[str, str]]) -> tuple[dict[str, dict], list[tuple[str, str]]]:
+    """({name: cached classification}, rows that still need a model call)."""
+    cache = result_cache()
+    cached, to_send = {}, []
+    for name, desc in rows:
+        hit = cache.get(name, desc)
+        if hit is not None:
+            cached[name] = hit
+        else:
+            to_send.append((name, desc))
+    return cached, to_send
+
+
+# ─── Helper: classify with retries (fallback for rows the batch rejects) ─────
 def safe_classify_entity(name: str, description: str, max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
     """
     Returns (success_flag, result_dict).
     success_flag = True  → parsed JSON returned
     success_flag = False → nothing parsed; caller must NOT checkpoint this name
     """
+    cached = result_cache().get(name, description)
+    if cached is not None:
+        return True, cached
+
     backoff = 2
+    parse_retried = False
     for attempt in range(1, max_retries + 1):
         try:
-            prompt = (
-                PROMPT_TEMPLATE
-                + f"\n\nNow classify the following company:\n"
-                + f"Name: {name}\n"
-                + f"Description (ID-check only – do NOT rely on it): {description}\n"
+            key_model = model_for_key(API_KEY)
+            resp = key_model.generate_content(
+                contents=prompt_for(key_model, build_user_turn(name, description)),
+                generation_config=GEN_CONFIG,
             )
-            resp = model.generate_content(
-                contents=prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.05,  # Very low temperature for more consistent formatting and reasoning
-                    candidate_count=1,
-                    stop_sequences=["</JSON>"],
-                    max_output_tokens=2048,
-                )
-            )
-            raw = resp.text.strip()
-
-            # Debug the raw response and search for tags
-            print(f"\n🔍 DEBUG - Raw response length for {name}: {len(raw)} chars")
-            start_tag = "<JSON>"
-            end_tag = "</JSON>"
-            
-            # Try printing the exact indices to debug
-            start_idx = raw.find(start_tag)
-            end_idx = raw.find(end_tag)
-            print(f"🔍 DEBUG - Tag indices: start_tag={start_idx}, end_tag={end_idx}")
-            
-            # If standard search fails, try a more forceful approach
-            if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
-                print(f"\n🔍 DEBUG - Standard tag search failed, trying direct JSON extraction")
-                # Try to find any JSON-like content
-                json_pattern = r'({.*?})'
-                json_matches = re.findall(json_pattern, raw, re.DOTALL)
-                
-                if json_matches:
-                    print(f"🔍 DEBUG - Found {len(json_matches)} potential JSON objects")
-                    # Try the first match that looks promising
-                    for potential_json in json_matches:
-                        try:
-                            # Clean up and try to parse
-                            clean_json = potential_json.replace("{{", "{").replace("}}", "}")
-                            clean_json = re.sub(r',\s*}', '}', clean_json)
-                            clean_json = clean_json.replace("'", '"')
-                            result = json.loads(clean_json)
-                            print(f"🔍 DEBUG - Successfully parsed JSON from pattern match!")
-                            return True, result
-                        except json.JSONDecodeError:
-                            continue
-                
-                # If we still can't find valid JSON, print the raw response for manual inspection
-                print(f"\n🔍 DEBUG - Raw response for {name}:\n{raw}\n")
-                raise ValueError("No valid JSON block found")
-            
-            # Extract the JSON text
-            json_text = raw[start_idx + len(start_tag):end_idx].strip()
-            print(f"🔍 DEBUG - Extracted JSON text length: {len(json_text)} chars")
-            
-            # Handle double braces
-            if json_text.startswith("{{") and json_text.endswith("}}"):
-                json_text = json_text[1:-1]
-                print("🔍 DEBUG - Removed double braces")
-            
-            # Clean up common JSON formatting issues
-            original_json = json_text
-            json_text = re.sub(r',\s*}', '}', json_text)  # Remove trailing commas
-            json_text = json_text.replace("'", '"')  # Replace single quotes with double quotes
-            
-            if original_json != json_text:
-                print("🔍 DEBUG - Cleaned up JSON formatting")
-            
-            # Try parsing the JSON with multiple fallback approaches
-            try:
-                result = json.loads(json_text)
-                print("🔍 DEBUG - Successfully parsed JSON!")
-                return True, result
-            except json.JSONDecodeError as e:
-                print(f"\n🔍 DEBUG - Error parsing JSON: {e}")
-                print(f"🔍 DEBUG - Extracted JSON for {name}:\n{json_text}\n")
-                
-                # Fallback: Try forcing the structure
-                try:
-                    print("🔍 DEBUG - Trying forceful JSON parsing...")
-                    # Attempt to force the JSON into a valid structure
-                    cleaned_json = re.sub(r'[^\x00-\x7F]+', '', json_text)  # Remove non-ASCII chars
-                    cleaned_json = re.sub(r'[\n\r\t]+', ' ', cleaned_json)  # Normalize whitespace
-                    result = json.loads(cleaned_json)
-                    print("🔍 DEBUG - Forceful JSON parsing succeeded!")
-                    return True, result
-                except json.JSONDecodeError:
-                    # Last attempt: Try to construct a minimal valid JSON
-                    print("🔍 DEBUG - Trying minimal JSON reconstruction...")
-                    minimal_json = {
-                        "is_startup": False,
-                        "is_startup_confidence": 0,
-                        "startup_rationale": "Parsing error",
-                        "is_gen_ai_startup": False,
-                        "is_gen_ai_startup_confidence": 0,
-                        "gen_ai_rationale": "Parsing error",
-                        "layer": None,
-                        "layer_confidence": 0,
-                        "category": None,
-                        "category_confidence": 0,
-                        "is_linked_to_france": False,
-                        "is_linked_to_france_confidence": 0
-                    }
-                    
-                    # Try to extract values from the text using regex
-                    try:
-                        confidence_matches = re.findall(r'"([^"]+)":\s*(\d+)', json_text)
-                        bool_matches = re.findall(r'"([^"]+)":\s*(true|false)', json_text.lower())
-                        string_matches = re.findall(r'"([^"]+)":\s*"([^"]+)"', json_text)
-                        
-                        # Update the minimal JSON with any values we could extract
-                        for key, value in confidence_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = int(value)
-                        
-                        for key, value in bool_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = value == 'true'
-                        
-                        for key, value in string_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = value
-                                
-                        print("🔍 DEBUG - Created minimal JSON with extracted values")
-                        return True, minimal_json
-                    except Exception as e:
-                        print(f"🔍 DEBUG - Minimal JSON reconstruction failed: {e}")
-                        raise ValueError(f"Failed to parse JSON: {e}")
-                raise
+            result = parse_classification(resp.text)
+            result_cache().put(name, description, result, raw=resp.text)
+            return True, result
         except api_exceptions.ResourceExhausted as e:
             # Handle rate limit
             retry_delay = 60  # Default to 60 seconds if not specified
             if hasattr(e, 'retry_delay') and e.retry_delay:
                 retry_delay = e.retry_delay.seconds
-            print(f"⏸️  Rate limit hit, waiting {retry_delay}s...")
+            logger.warning(f"⏸️  Rate limit hit, waiting {retry_delay}s...")
             time.sleep(retry_delay)
             continue
         except api_exceptions.ServiceUnavailable as e:
             code = getattr(e, "code", 503)
             if attempt < max_retries and code in (500, 502, 503, 504):
                 wait = backoff * attempt
-                print(f"[Retry {attempt}/{max_retries}] {code} – wait {wait}s")
+                logger.warning(f"[Retry {attempt}/{max_retries}] {code} – wait {wait}s")
                 time.sleep(wait)
                 continue
-            print(f"❌  ServiceUnavailable {code} for {name}")
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"❌  Parse error for {name}: {e}")
-            if attempt < max_retries:
-                wait = backoff * attempt
-                print(f"[Retry {attempt}/{max_retries}] Parse error – wait {wait}s")
-                time.sleep(wait)
+            logger.error(f"❌  ServiceUnavailable {code} for {name}")
+        except ValueError as e:
+            logger.error(f"❌  Parse error for {name}: {e}")
+            if not parse_retried and attempt < max_retries:
+                parse_retried = True  # JSON mode rarely fails twice; retry malformed output once
+                logger.warning(f"[Retry {attempt}/{max_retries}] Parse error")
                 continue
         except api_exceptions.BadRequest as e:
-            print(f"❌  BadRequest for {name}: {e}")
+            logger.error(f"❌  BadRequest for {name}: {e}")
         except Exception as e:
-            print(f"❌  Unexpected error for {name}: {e}")
+            logger.error(f"❌  Unexpected error for {name}: {e}")
         break                            # → exit retry loop
 
     # after all retries failed
     return False, {}                    # caller will log + retry later
 
 
-# ─── Load datasets ───────────────────────────────────────────────────────────
-existing_df = pd.read_csv(EXISTING_FILE)
-new_df      = pd.read_excel(NEW_FILE)        # Name + Description
+# ─── Helper: Gemini Batch Mode ────────────────────────────────────────────────
+def response_text(response: dict) -> str:
+    """Text of the first candidate of a REST/JSONL GenerateContentResponse ("" when blocked/empty)."""
+    candidates = response.get("candidates") or []
+    parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def write_batch_input(groups: list[list[tuple[str, str]]], path: str = BATCH_INPUT_FILE) -> None:
+    """Write one generateContent request per group of companies, keyed "group-<index>"."""
+    with open(path, "w", encoding="utf-8") as f:
+        for i, rows in enumerate(groups):
+            request = {
+                "contents": [{"role": "user", "parts": [{"text": PROMPT_STATIC + build_group_user_turn(rows)}]}],
+                "generation_config": generation_config_for(len(rows)),
+            }
+            f.write(json.dumps({"key": f"group-{i}", "request": request}, ensure_ascii=False) + "\n")
+
+
+def run_batch_job(path: str = BATCH_INPUT_FILE) -> dict[str, str]:
+    """
+    Upload the JSONL input, submit it as a batch job and wait for completion.
+    Returns {request_key: raw_response_text} for every request the batch answered.
+    """
+    batch_client = google_genai.Client(api_key=API_KEY)
+    uploaded = batch_client.files.upload(
+        file=path,
+        config=google_types.UploadFileConfig(display_name=os.path.basename(path), mime_type="jsonl"),
+    )
+    job = batch_client.batches.create(
+        model=MODEL,
+        src=uploaded.name,
+        config=google_types.CreateBatchJobConfig(display_name="genai-startup-mapping"),
+    )
+    logger.info(f"📦  Submitted batch job {job.name}")
+
+    while job.state.name not in BATCH_DONE_STATES:
+        logger.info(f"⏳  Batch {job.name} is {job.state.name}, checking again in {BATCH_POLL_SECONDS}s …")
+        time.sleep(BATCH_POLL_SECONDS)
+        job = batch_client.batches.get(name=job.name)
+
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        logger.error(f"❌  Batch job ended with {job.state.name}: {job.error}")
+        return {}
+
+    content = batch_client.files.download(file=job.dest.file_name).decode("utf-8")
+    responses = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        text = response_text(item.get("response", {}))
+        if text:
+            responses[item["key"]] = text
+        else:
+            logger.error(f"❌  Batch rejected {item.get('key')}: {item.get('error') or item.get('status')}")
+    return responses
+
+
+# ─── Helper: AIMD rate limiter (online mode) ──────────────────────────────────
+def server_retry_delay(headers, error: dict) -> float | None:
+    """
+    Seconds the server asked callers to wait: the RetryInfo detail of an error body,
+    else the Retry-After header; None when neither is there (or parses).
+    """
+    delay = headers.get("retry-after") if headers else None
+    for detail in error.get("details") or []:
+        if str(detail.get("@type", "")).endswith("google.rpc.RetryInfo"):
+            delay = str(detail.get("retryDelay", "")).rstrip("s") or delay
+    try:
+        return float(delay) if delay else None
+    except ValueError:
+        return None
+
+
+def retry_delay_seconds(e: Exception) -> float | None:
+    """Server-suggested wait from a quota error (RetryInfo), None when absent."""
+    delay = getattr(e, "retry_delay", None)
+    if delay is None:
+        for detail in getattr(e, "details", None) or []:
+            delay = getattr(detail, "retry_delay", None)
+            if delay is not None:
+                break
+    if delay is None:
+        return None
+    if hasattr(delay, "total_seconds"):
+        return delay.total_seconds()
+    return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+
+
+class SlidingWindow:
+    """
+    Client-side copy of the server's per-minute quota: requests and tokens started in the
+    last 60s. Callers are held back *before* a request would cross `rpm` (keeping 10% headroom)
+    or `tpm`, instead of discovering the limit through a 429.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.entries = deque()            # [start timestamp, tokens]; tokens corrected after the call
+
+    def wait_time(self, estimated_tokens: int, now: float) -> float:
+        """Seconds until a request of `estimated_tokens` fits in the window (0 = go now)."""
+        while self.entries and self.entries[0][0] <= now - 60:
+            self.entries.popleft()
+        if not self.entries:
+            return 0
+        over_rpm = self.rpm - len(self.entries) < max(1, self.rpm * 0.1)
+        over_tpm = sum(tokens for _, tokens in self.entries) + estimated_tokens > self.tpm
+        return self.entries[0][0] + 60 - now if over_rpm or over_tpm else 0
+
+    def add(self, tokens: int, now: float) -> list:
+        entry = [now, tokens]
+        self.entries.append(entry)
+        return entry
+
 
-# keep first two columns only
-new_df = new_df.iloc[:, :2]
-new_df.columns = ["Company Name", "Description"]
+class RateLimiter:
+    """
+    Shared AIMD backpressure for all online workers.
+    Concurrency grows by `alpha` after each fast success and is multiplied by `beta`
+    after a 429/5xx or when recent latency exceeds `target_latency`. Calls also wait
+    for room in a SlidingWindow of the aggregate RPM/TPM quota.
+    """
+
+    def __init__(self, rpm: int, tpm: int, c_max: float, c_min: float = 1.0, alpha: float = 0.5,
+                 beta: float = 0.5, target_latency: float = TARGET_LATENCY):
+        self.window = SlidingWindow(rpm, tpm)
+        self.c_min, self.c_max = c_min, c_max
+        self.alpha, self.beta = alpha, beta
+        self.target_latency = target_latency
+        self.concurrency = max(c_min, min(c_max, float(len(API_KEYS) or 1)))
+        self.in_flight = 0
+        self.latencies = deque(maxlen=20)
+        self.paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    def _wait_time(self, estimated_tokens: int, now: float) -> float | None:
+        """Seconds to wait before the next call, 0 when a slot is free, None to wait for a release."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        window_wait = self.window.wait_time(estimated_tokens, now)
+        if window_wait:
+            return window_wait
+        if self.in_flight >= int(self.concurrency):
+            return None
+        return 0
+
+    async def _acquire(self, estimated_tokens: int) -> list:
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(estimated_tokens, now)
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._cond.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+            return self.window.add(estimated_tokens, now)
+
+    async def _release(self, started: float, ok: bool, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        async with self._cond:
+            self.in_flight -= 1
+            self.latencies.append(now - started)
+            slow = sum(self.latencies) / len(self.latencies) > self.target_latency
+            if ok and not slow:
+                self.concurrency = min(self.c_max, self.concurrency + self.alpha)
+            else:
+                self.concurrency = max(self.c_min, self.concurrency * self.beta)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+                logger.warning(f"⏸️  Server asked to back off, pausing all workers {retry_after:.1f}s")
+            self._cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """
+        Hold one concurrency slot for the duration of a model call. Yields the window entry;
+        set entry[1] to the real token count once the response's usage metadata is known.
+        """
+        entry = await self._acquire(estimated_tokens)
+        started = entry[0]
+        try:
+            yield entry
+        except (api_exceptions.TooManyRequests, api_exceptions.ServerError, httpx.TransportError) as e:
+            await self._release(started, ok=False, retry_after=retry_delay_seconds(e))
+            raise
+        except BaseException:
+            await self._release(started, ok=True)
+            raise
+        else:
+            await self._release(started, ok=True)
+
+
+# ─── Helper: concurrent online mode ──────────────────────────────────────────
+_key_models = {}  # api_key → (GenerativeModel, time.time() after which it is rebuilt)
+
+def model_for_key(api_key: str) -> genai.GenerativeModel:
+    """
+    GenerativeModel for `api_key`. When possible PROMPT_STATIC is stored as a context cache
+    for that key (billed once per TTL) and exposed as `cached_content`; the model is rebuilt,
+    with a fresh cache, shortly before the TTL runs out.
+    """
+    entry = _key_models.get(api_key)
+    if entry and time.time() < entry[1]:
+        return entry[0]
+
+    key_model, refresh_at = None, float("inf")
+    if PROMPT_CACHE_TTL > 0:
+        try:
+            genai.configure(api_key=api_key)  # cache creation only goes through the default client
+            cache = genai.caching.CachedContent.create(
+                model=MODEL,
+                display_name="genai-startup-prompt",
+                system_instruction=PROMPT_STATIC,
+                ttl=datetime.timedelta(seconds=PROMPT_CACHE_TTL),
+            )
+            key_model = genai.GenerativeModel.from_cached_content(cache)
+            refresh_at = time.time() + PROMPT_CACHE_TTL * 0.9
+        except Exception as e:
+            logger.warning(f"⚠️  Context caching unavailable, sending the full prompt: {e}")
+        finally:
+            genai.configure(api_key=API_KEY)
+
+    if key_model is None:
+        key_model = genai.GenerativeModel(MODEL)
+    _key_models[api_key] = (key_model, refresh_at)
+    return key_model
+
+
+class GeminiClient:
+    """
+    Direct REST calls to generateContent over one pooled HTTP/2 client.
+    The API key travels with each request, so every key shares the same connection
+    instead of going through the SDK's process-global genai.configure().
+    """
+
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(http2=True, timeout=60, limits=httpx.Limits(max_connections=100))
+
+    async def generate(self, api_key: str, text: str, cached_content: str | None = None,
+                       generation_config: dict = GENERATION_CONFIG) -> tuple[str, int]:
+        """
+        (response text, total token count) for a single user turn. HTTP errors are raised as the
+        matching google.api_core exception, with `retry_delay` set from Retry-After / RetryInfo.
+        """
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "generationConfig": generation_config,
+        }
+        if cached_content:
+            body["cachedContent"] = cached_content
+        resp = await self.client.post(
+            f"{self.BASE_URL}/models/{MODEL}:generateContent",
+            params={"key": api_key},
+            content=orjson.dumps(body),
+            headers={"Content-Type": "application/json"},
+        )
+        if resp.status_code != 200:
+            raise self._error(resp)
+        data = orjson.loads(resp.content)
+        text = response_text(data)
+        if not text:
+            raise ValueError("Response has no text (blocked or empty candidate)")
+        return text, data.get("usageMetadata", {}).get("totalTokenCount", 0)
+
+    @staticmethod
+    def _error(resp: httpx.Response) -> api_exceptions.GoogleAPICallError:
+        try:
+            error = orjson.loads(resp.content).get("error", {})
+        except orjson.JSONDecodeError:
+            error = {}
+        e = api_exceptions.from_http_status(resp.status_code, error.get("message", resp.text), response=resp)
+        delay = server_retry_delay(resp.headers, error)
+        if delay is not None:
+            e.retry_delay = datetime.timedelta(seconds=delay)
+        return e
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+async def take_key_permit(key_slot: asyncio.Semaphore | None) -> None:
+    """One of the key's PER_KEY_RPM permits, handed back 60s later (≤ PER_KEY_RPM calls per minute per key)."""
+    if key_slot is not None:
+        await key_slot.acquire()
+        asyncio.get_running_loop().call_later(60, key_slot.release)
+
+
+async def classify_entity_async(client: GeminiClient, api_key: str, limiter: RateLimiter, name: str,
+                                description: str, key_slot: asyncio.Semaphore | None = None,
+                                max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
+    """
+    Async counterpart of safe_classify_entity, same (success_flag, result_dict) contract.
+    Pacing after 429/5xx is left to `limiter` instead of fixed sleeps.
+    """
+    results = await classify_group_async(client, api_key, limiter, [(name, description)], key_slot, max_retries)
+    return (True, results[name]) if name in results else (False, {})
+
+
+async def classify_group_async(client: GeminiClient, api_key: str, limiter: RateLimiter,
+                               rows: list[tuple[str, str]], key_slot: asyncio.Semaphore | None = None,
+                               max_retries: int = MAX_RETRIES) -> dict[str, dict]:
+    """
+    Classify `rows` in a single call. Returns {company_name: result_dict} for the companies
+    answered (from the cache or the model); callers retry the missing ones on their own.
+    Every attempt, retries included, takes a permit from `key_slot` (the key's RPM budget).
+    """
+    results, rows = split_cached(rows)
+    if not rows:
+        return results
+    label = rows[0][0] if len(rows) == 1 else f"group of {len(rows)} ({rows[0][0]} …)"
+    user_turn = build_group_user_turn(rows)
+    generation_config = generation_config_for(len(rows))
+
+    parse_retried = False
+    for attempt in range(1, max_retries + 1):
+        try:
+            key_model = model_for_key(api_key)  # only for its context cache
+            prompt = prompt_for(key_model, user_turn)
+            await take_key_permit(key_slot)
+            async with limiter.slot(estimated_tokens=len(prompt) // 4) as window_entry:
+                text, window_entry[1] = await client.generate(
+                    api_key, prompt, key_model.cached_content, generation_config
+                )
+            parsed = parse_group(text, rows)
+            raw_items = group_raw_items(text, rows)
+            for name, desc in rows:
+                if name in parsed:
+                    result_cache().put(name, desc, parsed[name], raw=raw_items.get(name))
+            results.update(parsed)
+            return results
+        except api_exceptions.TooManyRequests:  # HTTP 429 (ResourceExhausted is its gRPC form)
+            logger.warning(f"[Retry {attempt}/{max_retries}] Rate limit hit for {label}")
+            continue
+        except (api_exceptions.ServerError, httpx.TransportError) as e:
+            code = getattr(e, "code", 503)
+            if attempt < max_retries and code in (500, 502, 503, 504):
+                logger.warning(f"[Retry {attempt}/{max_retries}] {code} for {label}")
+                continue
+            logger.error(f"❌  Server error {code} for {label}")
+        except ValueError as e:
+            logger.error(f"❌  Parse error for {label}: {e}")
+            if not parse_retried and attempt < max_retries:
+                parse_retried = True
+                logger.warning(f"[Retry {attempt}/{max_retries}] Parse error")
+                continue
+        except api_exceptions.BadRequest as e:
+            logger.error(f"❌  BadRequest for {label}: {e}")
+        except Exception as e:
+            logger.error(f"❌  Unexpected error for {label}: {e}")
+        break                            # → exit retry loop
+
+    return results
+
+
+async def run_online(pending: list[tuple[str, str]], processed_set: set, output: "ResultWriter") -> None:
+    """
+    Classify `pending` concurrently, COMPANIES_PER_PROMPT companies per call: PER_KEY_RPM workers
+    per API key, each key gated by its own semaphore whose permits are handed back 60s after use
+    (≤ PER_KEY_RPM calls per minute per key, counting retries and per-company fallbacks).
+    Companies a group call leaves out are retried alone.
+    """
+    queue = asyncio.Queue()
+    for group in chunked(pending):
+        queue.put_nowait(group)
+
+    key_slots = [asyncio.Semaphore(PER_KEY_RPM) for _ in API_KEYS]
+    n_workers = len(API_KEYS) * PER_KEY_RPM
+    limiter = RateLimiter(rpm=n_workers, tpm=len(API_KEYS) * PER_KEY_TPM, c_max=n_workers)
+    client = GeminiClient()
+
+    async def worker(key_idx: int):
+        while True:
+            try:
+                group = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            api_key, key_slot = API_KEYS[key_idx], key_slots[key_idx]
+            results = await classify_group_async(client, api_key, limiter, group, key_slot)
+            for name, desc in group:
+                if name in results:
+                    success, result = True, results[name]
+                elif len(group) > 1:
+                    success, result = await classify_entity_async(client, api_key, limiter, name, desc, key_slot)
+                else:
+                    success, result = False, {}
+                record_result(name, desc, success, result, processed_set, output)
+
+    workers = [worker(i % len(API_KEYS)) for i in range(n_workers)]
+    logger.info(f"🚀  Online mode: {len(workers)} workers over {len(API_KEYS)} API key(s)")
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        await client.aclose()
+
+
+# ─── Helper: checkpoint & stream one result ──────────────────────────────────
+RECORD_FIELDS = [
+    "Company Name", "Description", "Layer", "Layer Confidence", "Category", "Category Confidence",
+    "Startup Confidence", "GenAI Confidence", "Linked to France", "France Confidence",
+]
+
+
+class ResultWriter:
+    """
+    Appends Gen-AI startups to OUTPUT_FILE as they are classified, so a crash never loses
+    finished rows. A missing (or older, narrower) output file is first seeded from existing_file.
+    """
+
+    def __init__(self, existing_file: str = EXISTING_FILE, path: str = OUTPUT_FILE):
+        exists = os.path.exists(path)
+        seed_file = path if exists else existing_file
+        fieldnames = list(pd.read_csv(seed_file, nrows=0).columns)
+        missing = [f for f in RECORD_FIELDS if f not in fieldnames]
+        if not exists or missing:
+            base_df = pd.read_csv(seed_file)
+            base_df.reindex(columns=fieldnames + missing).to_csv(path, index=False)
+            fieldnames += missing
 
-todo_df = new_df[~new_df["Company Name"].isin(existing_df["Company Name"])]
-print(f"Found {len(todo_df)} new companies to process")
+        self.count = 0
+        self._fh = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._fh, fieldnames=fieldnames, extrasaction="ignore")
 
-# ─── Checkpoint ───────────────────────────────────────────────────────────────
-processed_set = set()
-if os.path.exists(CHECKPOINT_FILE):
-    processed_set = {line.strip() for line in open(CHECKPOINT_FILE, encoding="utf-8")}
+    def write(self, record: dict) -> None:
+        self._writer.writerow(record)
+        self._fh.flush()
+        self.count += 1
 
-# ─── Main loop ────────────────────────────────────────────────────────────────
-records = []
-batch_counter = 0  # counts calls since last sleep
+    def close(self) -> None:
+        self._fh.close()
 
-for _, row in todo_df.iterrows():
-    name = row["Company Name"]
-    desc = row["Description"]
 
-    # Skip if already processed in a previous run
-    if name in processed_set:
-        continue
+# Line-buffered handles kept open for the whole run (see open_progress_files)
+ckpt_fh = None
+err_fh = None
 
-    success, result = safe_classify_entity(name, desc)
+def open_progress_files() -> None:
+    """Open CHECKPOINT_FILE / ERROR_FILE once; every write is flushed at the newline."""
+    global ckpt_fh, err_fh
+    ckpt_fh = open(CHECKPOINT_FILE, "a", encoding="utf-8", buffering=1)
+    err_fh = open(ERROR_FILE, "a", encoding="utf-8", buffering=1)
+    atexit.register(ckpt_fh.close)
+    atexit.register(err_fh.close)
 
+
+def record_result(name: str, desc: str, success: bool, result: dict, processed_set: set,
+                  output: ResultWriter) -> None:
     if not success:
         # Keep a log of items that still need processing; do NOT checkpoint the name
-        with open(ERROR_FILE, "a", encoding="utf-8") as err:
-            err.write(name + "\n")
-        continue  # move to next company
+        err_fh.write(name + "\n")
+        return
 
     # ► Successful parse → checkpoint immediately
-    with open(CHECKPOINT_FILE, "a", encoding="utf-8") as f:
-        f.write(name + "\n")
+    ckpt_fh.write(name + "\n")
     processed_set.add(name)
 
-    # Manual pause every X successful API calls
-    batch_counter += 1
-    if batch_counter >= BATCH_SIZE:
-        print(f"⏸️  Pausing {PAUSE_SECONDS}s to respect rate limits …")
-        time.sleep(PAUSE_SECONDS)
-        batch_counter = 0
-
-    # Collect Gen-AI startups for the final mapping
+    # Stream Gen-AI startups straight into the mapping
     if result.get("is_startup") and result.get("is_gen_ai_startup"):
-        records.append(
+        output.write(
             {
                 "Company Name": name,
                 "Description": desc,
@@ -457,11 +988,101 @@ for _, row in todo_df.iterrows():
             }
         )
 
-# ─── Save output ─────────────────────────────────────────────────────────────
-updated_df = (
-    pd.concat([existing_df, pd.DataFrame(records)], ignore_index=True)
-    if records else existing_df
-)
-updated_df.to_csv(OUTPUT_FILE, index=False)
-print(f"✅  Added {len(records)} Gen-AI startups → {OUTPUT_FILE}")
-print(f"🔖  Progress checkpoint saved to {CHECKPOINT_FILE}")
+
+def run_batch(pending: list[tuple[str, str]], processed_set: set, output: ResultWriter) -> None:
+    """
+    Classify `pending` through one Batch Mode job (COMPANIES_PER_PROMPT companies per request),
+    falling back per row on rejects.
+    """
+    cache = result_cache()
+    answered, to_submit = split_cached(pending)
+    if answered:
+        logger.info(f"♻️  {len(answered)} companies answered from {CACHE_FILE}")
+
+    if to_submit:
+        groups = chunked(to_submit)
+        write_batch_input(groups)
+        logger.info(f"📝  Wrote {len(groups)} requests for {len(to_submit)} companies → {BATCH_INPUT_FILE}")
+        responses = run_batch_job()
+        for i, rows in enumerate(groups):
+            if f"group-{i}" not in responses:
+                continue
+            try:
+                parsed = parse_group(responses[f"group-{i}"], rows)
+                raw_items = group_raw_items(responses[f"group-{i}"], rows)
+            except ValueError as e:
+                logger.error(f"❌  Parse error for batch request group-{i}: {e}")
+                continue
+            for name, desc in rows:
+                if name in parsed:
+                    cache.put(name, desc, parsed[name], raw=raw_items.get(name))
+            answered.update(parsed)
+
+    for name, desc in pending:
+        if name in answered:
+            success, result = True, answered[name]
+        else:
+            # Rows the batch rejected, skipped or answered unusably → synchronous fallback
+            success, result = safe_classify_entity(name, desc)
+
+        record_result(name, desc, success, result, processed_set, output)
+
+
+def name_key(names):
+    """Join key that treats "Acme " and "acme" as the same company (a single name or a whole column)."""
+    if isinstance(names, str):
+        return names.strip().lower()
+    return names.astype(str).str.strip().str.lower()
+
+
+def main():
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s")
+
+    # ─── Load datasets ───────────────────────────────────────────────────────
+    # Only the name column is needed for the set-difference; calamine parses the workbook in Rust
+    existing_df = pd.read_csv(EXISTING_FILE, engine="pyarrow", usecols=["Company Name"])
+    new_df      = pd.read_excel(                 # Name + Description, first two columns only
+        NEW_FILE, engine="calamine", usecols=[0, 1], names=["Company Name", "Description"]
+    )
+
+    # hash-join on a case/whitespace-insensitive key instead of a Python-level isin mask
+    seen = (
+        pd.DataFrame({"_key": name_key(existing_df["Company Name"])})
+        .drop_duplicates()
+        .assign(_seen=1)
+    )
+    todo_df = new_df.assign(_key=name_key(new_df["Company Name"])).merge(seen, on="_key", how="left")
+    todo_df = todo_df[todo_df["_seen"].isna()].drop(columns=["_key", "_seen"])
+    # names key the results of a multi-company prompt, so they must be unique
+    todo_df = todo_df.drop_duplicates(subset=["Company Name"])
+    logger.info(f"Found {len(todo_df)} new companies to process")
+
+    # ─── Checkpoint ──────────────────────────────────────────────────────────
+    processed_set = set()
+    if os.path.exists(CHECKPOINT_FILE):
+        # one read + one decode; splitlines runs in C instead of a per-line Python loop
+        with open(CHECKPOINT_FILE, "rb") as f:
+            processed_set = set(f.read().decode("utf-8").splitlines())
+        processed_set.discard("")
+
+    # Skip rows already processed in a previous run with one vectorized filter
+    todo_df = todo_df[~todo_df["Company Name"].isin(processed_set)].reset_index(drop=True)
+    pending = list(zip(todo_df["Company Name"].values, todo_df["Description"].values))
+
+    # ─── Classify (results stream into OUTPUT_FILE) ──────────────────────────
+    open_progress_files()
+    output = ResultWriter()
+    try:
+        if RUN_MODE == "online":
+            asyncio.run(run_online(pending, processed_set, output))
+        else:
+            run_batch(pending, processed_set, output)
+    finally:
+        output.close()
+
+    logger.info(f"✅  Added {output.count} Gen-AI startups → {OUTPUT_FILE}")
+    logger.info(f"🔖  Progress checkpoint saved to {CHECKPOINT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
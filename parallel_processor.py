@@ -1,14 +1,18 @@
 import os
 import re
-import json
 import time
+import queue
+import logging
+import threading
 import pandas as pd
-import concurrent.futures
-from threading import Lock
+import asyncio
+import itertools
+import functools
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from aiolimiter import AsyncLimiter
 from google.api_core import exceptions as api_exceptions
 from dotenv import load_dotenv
-import random
 
 # ─── Load environment variables ────────────────────────────────────────────────
 load_dotenv()  # Load .env file
@@ -28,239 +32,252 @@ ERROR_FILE = os.getenv("ERROR_FILE", "errors_unprocessed.txt")
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
 MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))  # Number of parallel workers
-QUOTA_PER_MINUTE = int(os.getenv("QUOTA_PER_MINUTE", "15"))  # API calls allowed per minute
+QUOTA_PER_MINUTE = int(os.getenv("QUOTA_PER_MINUTE", "15"))  # API calls allowed per minute on each key
 WAIT_AFTER_QUOTA = int(os.getenv("WAIT_AFTER_QUOTA", "60"))  # Seconds to wait after hitting quota
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG also logs every company as it starts
 
-# Print configuration summary
-print(f"🚀 Starting parallel processor with {MAX_WORKERS} workers")
-print(f"📋 Processing from {NEW_FILE} → {OUTPUT_FILE}")
-print(f"🔑 Using {len(API_KEYS)} API key(s)")
-print(f"⏱️  Quota: {QUOTA_PER_MINUTE} requests/minute, {WAIT_AFTER_QUOTA}s wait time")
+logger = logging.getLogger(__name__)
 
-# Global locks and counters for managing API quotas
-api_call_lock = Lock()
-checkpoint_lock = Lock()
-error_lock = Lock()
-output_lock = Lock()
-quota_reset_time = time.time() + 60  # Reset quota counter every minute
-api_calls_in_window = 0
+# Prompt, JSON-mode generation config and parser are shared with main.py
+from main import (
+    COMPANIES_PER_PROMPT, GEN_CONFIG, PROMPT_STATIC, ResultWriter, build_group_user_turn, build_prompt,
+    generation_config_for, group_raw_items, name_key, parse_classification, parse_group, result_cache,
+)
 
-# Import the prompt template from main.py
-from main import PROMPT_TEMPLATE
+# ─── Helper: near-duplicate lookup ────────────────────────────────────────────
+_RE_DOTS = re.compile(r"[.'’]")  # "S.A." → "sa", "L'Oréal" → "loréal"
+_RE_PUNCT = re.compile(r"[^\w\s]+")
+_RE_SPACES = re.compile(r"\s+")
+_RE_LEGAL_SUFFIX = re.compile(r"(\s(inc|ltd|llc|corp|co|sa|sas|sasu|sarl|gmbh|bv))+$")  # "acme co inc" → "acme"
+
+def normalize(text) -> str:
+    """
+    Text with case, punctuation, spacing and a trailing legal form removed, so
+    "Acme, Inc." and "ACME inc" map to the same cache entry ("acme").
+    """
+    text = _RE_DOTS.sub("", str(text).lower())
+    text = _RE_SPACES.sub(" ", _RE_PUNCT.sub(" ", text)).strip()
+    return _RE_LEGAL_SUFFIX.sub("", text).strip()
 
 # ─── Helper: classify with retries ────────────────────────────────────────────
-def get_api_key():
-    """Get an API key from the pool, rotating if multiple keys are available"""
-    return random.choice(API_KEYS)
+def build_model(api_key: str) -> genai.GenerativeModel:
+    """GenerativeModel with its own async client bound to `api_key` (genai.configure() is process-global)"""
+    model = genai.GenerativeModel(MODEL)
+    model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return model
+
+class ApiKey:
+    """One API key: its long-lived model (and gRPC channel) plus its own quota bucket"""
 
-def safe_classify_entity(name: str, description: str, max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
+    def __init__(self, api_key: str):
+        self.model = build_model(api_key)
+        # Leaky bucket per key, so every extra key adds QUOTA_PER_MINUTE of throughput.
+        # A worker waiting on it just yields to the others
+        self.quota = AsyncLimiter(QUOTA_PER_MINUTE, 60)
+        self.cooling_until = 0.0  # time.monotonic() before which the server refuses this key (429)
+
+# Handed out round-robin. Built on first use because grpc.aio channels belong to the
+# event loop that creates them.
+_keys = None
+_key_cycle = None
+
+def get_key() -> ApiKey:
     """
-    Returns (success_flag, result_dict).
-    success_flag = True  → parsed JSON returned
-    success_flag = False → nothing parsed; caller must NOT checkpoint this name
-    
-    This version manages API quotas across multiple workers.
+    Get the next key from the pool that is not cooling down after a 429, rotating if
+    multiple keys are available. When every key is cooling, the one that recovers first.
+    """
+    global _keys, _key_cycle
+    if _keys is None:
+        _keys = [ApiKey(k) for k in API_KEYS]
+        _key_cycle = itertools.cycle(_keys)
+    now = time.monotonic()
+    for _ in range(len(_keys)):
+        key = next(_key_cycle)
+        if key.cooling_until <= now:
+            return key
+    return min(_keys, key=lambda k: k.cooling_until)
+
+def cached_result(name: str, description: str) -> dict | None:
+    """
+    Same SQLite cache as main.py: re-runs and duplicate rows skip the API entirely.
+    Results are also stored under the normalized name/description to catch typographic variants.
+    Anything but a classification object is treated as a miss, so the next success overwrites it.
+    """
+    cache = result_cache()
+    cached = cache.get(name, description)
+    norm_name = normalize(name)
+    if not isinstance(cached, dict) and norm_name:
+        cached = cache.get(norm_name, normalize(description))
+    return cached if isinstance(cached, dict) else None
+
+def store_result(name: str, description: str, result: dict, raw: str | None = None) -> None:
+    cache = result_cache()
+    cache.put(name, description, result, raw=raw)
+    norm_name = normalize(name)
+    if norm_name:
+        cache.put(norm_name, normalize(description), result)
+
+@functools.lru_cache(maxsize=None)
+def group_gen_config(count: int) -> genai.types.GenerationConfig:
+    """GenerationConfig for a prompt holding `count` companies, built once per group size"""
+    return genai.types.GenerationConfig(**generation_config_for(count))
+
+async def generate(contents: str, generation_config, parse, label: str, max_retries: int = MAX_RETRIES):
+    """
+    Call the model with retries and return (parsed result, raw text), or (None, None) once
+    retries are exhausted. Manages API quotas across multiple workers.
     """
-    global api_calls_in_window, quota_reset_time
-    
     backoff = 2
+    parse_retried = False
     for attempt in range(1, max_retries + 1):
         try:
-            # Check quota and wait if needed
-            with api_call_lock:
-                current_time = time.time()
-                
-                # Reset counter if we're in a new time window
-                if current_time > quota_reset_time:
-                    api_calls_in_window = 0
-                    quota_reset_time = current_time + 60
-                
-                # If we've hit our quota for this minute, wait
-                if api_calls_in_window >= QUOTA_PER_MINUTE:
-                    wait_time = quota_reset_time - current_time
-                    print(f"⏸️  Thread quota limit reached, waiting {wait_time:.1f}s...")
-                    time.sleep(wait_time)
-                    # After waiting, recalculate time and reset quota
-                    current_time = time.time()
-                    api_calls_in_window = 0
-                    quota_reset_time = current_time + 60
-                
-                # Increment the counter and proceed
-                api_calls_in_window += 1
-            
-            # Setup Gemini client with a potentially different API key for each call
-            api_key = get_api_key()
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(MODEL)
-                
-            prompt = (
-                PROMPT_TEMPLATE
-                + f"\n\nNow classify the following company:\n"
-                + f"Name: {name}\n"
-                + f"Description (ID-check only – do NOT rely on it): {description}\n"
-            )
-            
-            resp = model.generate_content(
-                contents=prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.05,  # Very low temperature for more consistent formatting and reasoning
-                    candidate_count=1,
-                    stop_sequences=["</JSON>"],
-                    max_output_tokens=2048,
-                )
-            )
-            raw = resp.text.strip()
-
-            # Search for JSON tags (minimal debug output)
-            start_tag = "<JSON>"
-            end_tag = "</JSON>"
-            start_idx = raw.find(start_tag)
-            end_idx = raw.find(end_tag)
-            
-            # If standard search fails, try a more forceful approach
-            if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
-                # Try to find any JSON-like content
-                json_pattern = r'({.*?})'
-                json_matches = re.findall(json_pattern, raw, re.DOTALL)
-                
-                if json_matches:
-                    # Try the first match that looks promising
-                    for potential_json in json_matches:
-                        try:
-                            # Clean up and try to parse
-                            clean_json = potential_json.replace("{{", "{").replace("}}", "}")
-                            clean_json = re.sub(r',\s*}', '}', clean_json)
-                            clean_json = clean_json.replace("'", '"')
-                            result = json.loads(clean_json)
-                            return True, result
-                        except json.JSONDecodeError:
-                            continue
-                
-                # If we still can't find valid JSON
-                print(f"❌ No valid JSON found for {name}")
-                raise ValueError("No valid JSON block found")
-            
-            # Extract the JSON text
-            json_text = raw[start_idx + len(start_tag):end_idx].strip()
-            
-            # Handle double braces
-            if json_text.startswith("{{") and json_text.endswith("}}"):
-                json_text = json_text[1:-1]
-            
-            # Clean up common JSON formatting issues
-            json_text = re.sub(r',\s*}', '}', json_text)  # Remove trailing commas
-            json_text = json_text.replace("'", '"')  # Replace single quotes with double quotes
-            
-            # Try parsing the JSON with multiple fallback approaches
-            try:
-                result = json.loads(json_text)
-                return True, result
-            except json.JSONDecodeError as e:
-                # Fallback: Try forcing the structure
-                try:
-                    # Attempt to force the JSON into a valid structure
-                    cleaned_json = re.sub(r'[^\x00-\x7F]+', '', json_text)  # Remove non-ASCII chars
-                    cleaned_json = re.sub(r'[\n\r\t]+', ' ', cleaned_json)  # Normalize whitespace
-                    result = json.loads(cleaned_json)
-                    return True, result
-                except json.JSONDecodeError:
-                    # Last attempt: Try to construct a minimal valid JSON
-                    minimal_json = {
-                        "is_startup": False,
-                        "is_startup_confidence": 0,
-                        "startup_rationale": "Parsing error",
-                        "is_gen_ai_startup": False,
-                        "is_gen_ai_startup_confidence": 0,
-                        "gen_ai_rationale": "Parsing error",
-                        "layer": None,
-                        "layer_confidence": 0,
-                        "category": None,
-                        "category_confidence": 0,
-                        "is_linked_to_france": False,
-                        "is_linked_to_france_confidence": 0
-                    }
-                    
-                    # Try to extract values from the text using regex
-                    try:
-                        confidence_matches = re.findall(r'"([^"]+)":\s*(\d+)', json_text)
-                        bool_matches = re.findall(r'"([^"]+)":\s*(true|false)', json_text.lower())
-                        string_matches = re.findall(r'"([^"]+)":\s*"([^"]+)"', json_text)
-                        
-                        # Update the minimal JSON with any values we could extract
-                        for key, value in confidence_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = int(value)
-                        
-                        for key, value in bool_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = value == 'true'
-                        
-                        for key, value in string_matches:
-                            if key in minimal_json:
-                                minimal_json[key] = value
-                                
-                        return True, minimal_json
-                    except Exception as e:
-                        print(f"❌ JSON reconstruction failed for {name}: {e}")
-                        raise ValueError(f"Failed to parse JSON: {e}")
-                raise
+            # Rotate keys per call, then wait for that key's quota (other workers keep running)
+            key = get_key()
+            cooldown = key.cooling_until - time.monotonic()
+            if cooldown > 0:
+                logger.warning(f"⏸️  All keys rate limited, waiting {cooldown:.1f}s...")
+                await asyncio.sleep(cooldown)
+            await key.quota.acquire()
+
+            # JSON mode + response schema: resp.text is the JSON answer itself
+            resp = await key.model.generate_content_async(contents=contents, generation_config=generation_config)
+            raw = resp.text
+            return parse(raw), raw
         except api_exceptions.ResourceExhausted as e:
-            # Handle rate limit
+            # Handle rate limit: rest this key and retry straight away on another one
             retry_delay = WAIT_AFTER_QUOTA  # Default to configured value
             if hasattr(e, 'retry_delay') and e.retry_delay:
                 retry_delay = e.retry_delay.seconds
-            print(f"⏸️  Rate limit hit, waiting {retry_delay}s...")
-            time.sleep(retry_delay)
+            key.cooling_until = time.monotonic() + retry_delay
+            logger.warning(f"⏸️  Rate limit hit, resting this key for {retry_delay}s...")
             continue
         except api_exceptions.ServiceUnavailable as e:
             code = getattr(e, "code", 503)
             if attempt < max_retries and code in (500, 502, 503, 504):
                 wait = backoff * attempt
-                print(f"[Retry {attempt}/{max_retries}] {code} – wait {wait}s")
-                time.sleep(wait)
+                logger.warning(f"[Retry {attempt}/{max_retries}] {code} – wait {wait}s")
+                await asyncio.sleep(wait)
                 continue
-            print(f"❌  ServiceUnavailable {code} for {name}")
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"❌  Parse error for {name}: {e}")
-            if attempt < max_retries:
-                wait = backoff * attempt
-                print(f"[Retry {attempt}/{max_retries}] Parse error – wait {wait}s")
-                time.sleep(wait)
+            logger.error(f"❌  ServiceUnavailable {code} for {label}")
+        except ValueError as e:
+            logger.error(f"❌  Parse error for {label}: {e}")
+            if not parse_retried and attempt < max_retries:
+                parse_retried = True  # JSON mode rarely fails twice; retry malformed output once
+                logger.warning(f"[Retry {attempt}/{max_retries}] Parse error")
                 continue
         except api_exceptions.BadRequest as e:
-            print(f"❌  BadRequest for {name}: {e}")
+            logger.error(f"❌  BadRequest for {label}: {e}")
         except Exception as e:
-            print(f"❌  Unexpected error for {name}: {e}")
+            logger.error(f"❌  Unexpected error for {label}: {e}")
         break                            # → exit retry loop
 
     # after all retries failed
-    return False, {}                    # caller will log + retry later
+    return None, None
 
-def process_company(row):
-    """Process a single company - used by worker threads"""
-    name = row["Company Name"]
-    desc = row["Description"]
-    
-    # Skip if already processed in a previous run
-    with checkpoint_lock:
-        if name in processed_set:
-            return None
-    
-    print(f"Processing: {name}")
-    success, result = safe_classify_entity(name, desc)
+async def safe_classify_entity(name: str, description: str, max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
+    """
+    Returns (success_flag, result_dict).
+    success_flag = True  → parsed JSON returned
+    success_flag = False → nothing parsed; caller must NOT checkpoint this name
+    """
+    cached = cached_result(name, description)
+    if cached is not None:
+        return True, cached
+
+    result, raw = await generate(build_prompt(name, description), GEN_CONFIG, parse_classification, name, max_retries)
+    if result is None:
+        return False, {}                # caller will log + retry later
+    store_result(name, description, result, raw=raw)
+    return True, result
+
+async def classify_group(rows: list[tuple[str, str]], max_retries: int = MAX_RETRIES) -> dict[str, dict]:
+    """
+    Classify several companies with a single call (main.py's multi-company prompt).
+    Returns {company_name: result_dict} for the ones answered; callers retry the rest alone.
+    """
+    results, to_send = {}, []
+    for name, desc in rows:
+        cached = cached_result(name, desc)
+        if cached is not None:
+            results[name] = cached
+        else:
+            to_send.append((name, desc))
+    if len(to_send) < 2:
+        return results                  # a lone company goes through safe_classify_entity
+
+    label = f"group of {len(to_send)} ({to_send[0][0]} …)"
+    parsed, raw = await generate(
+        PROMPT_STATIC + build_group_user_turn(to_send), group_gen_config(len(to_send)),
+        lambda raw: parse_group(raw, to_send), label, max_retries,
+    )
+    raw_items = group_raw_items(raw, to_send) if parsed else {}
+    for name, desc in to_send:
+        if parsed and name in parsed:
+            store_result(name, desc, parsed[name], raw=raw_items.get(name))
+            results[name] = parsed[name]
+    return results
+
+async def process_group(rows):
+    """
+    Process up to COMPANIES_PER_PROMPT companies with one model call - used by the worker
+    coroutines. Returns the Gen-AI startup records found.
+    """
+    # Already-processed rows were filtered out in main(), before any group was built.
+    # No locks needed below: workers share one thread and only switch at an await
+    rows = [(row["Company Name"], row["Description"]) for row in rows]
     
+    results = await classify_group(rows)
+    records = []
+    for name, desc in rows:
+        logger.debug("Processing: %s", name)
+        if name in results:
+            success, result = True, results[name]
+        else:
+            # Single rows, and companies the group call left out
+            success, result = await safe_classify_entity(name, desc)
+        records.append(record_result(name, desc, success, result))
+    return records
+
+class LineWriter:
+    """
+    Appends lines to `path` from one background thread, so workers only enqueue.
+    The file stays open for the whole run and is flushed whenever the queue runs dry.
+    """
+
+    def __init__(self, path: str):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(path,), daemon=True)
+        self._thread.start()
+
+    def write(self, line: str) -> None:
+        self._queue.put(line)
+
+    def _run(self, path: str) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            while (line := self._queue.get()) is not None:
+                f.write(line + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        """Write everything still queued, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+# Opened in main()
+checkpoint_writer = None
+error_writer = None
+
+def record_result(name, desc, success, result):
+    """Checkpoint one classification; returns its mapping record for Gen-AI startups, else None"""
     if not success:
         # Keep a log of items that still need processing; do NOT checkpoint the name
-        with error_lock:
-            with open(ERROR_FILE, "a", encoding="utf-8") as err:
-                err.write(name + "\n")
+        error_writer.write(name)
         return None
     
     # ► Successful parse → checkpoint immediately
-    with checkpoint_lock:
-        with open(CHECKPOINT_FILE, "a", encoding="utf-8") as f:
-            f.write(name + "\n")
-        processed_set.add(name)
+    checkpoint_writer.write(name)
+    processed_set.add(name)
     
     # Collect Gen-AI startups for the final mapping
     if result.get("is_startup") and result.get("is_gen_ai_startup"):
@@ -281,76 +298,100 @@ def process_company(row):
     return None
 
 def main():
-    global processed_set
+    global processed_set, checkpoint_writer, error_writer
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s")
+    logger.info(f"🚀 Starting parallel processor with {MAX_WORKERS} workers")
+    logger.info(f"📋 Processing from {NEW_FILE} → {OUTPUT_FILE}")
+    logger.info(f"🔑 Using {len(API_KEYS)} API key(s)")
+    logger.info(f"⏱️  Quota: {QUOTA_PER_MINUTE} requests/minute per key, {WAIT_AFTER_QUOTA}s wait time")
     
     # ─── Load datasets ───────────────────────────────────────────────────────────
     existing_df = pd.read_csv(EXISTING_FILE)
-    new_df = pd.read_excel(NEW_FILE)        # Name + Description
-    
-    # keep first two columns only
-    new_df = new_df.iloc[:, :2]
-    new_df.columns = ["Company Name", "Description"]
+    new_df = pd.read_excel(                 # Name + Description, first two columns only
+        NEW_FILE, engine="calamine", usecols=[0, 1], names=["Company Name", "Description"]
+    )
     
-    todo_df = new_df[~new_df["Company Name"].isin(existing_df["Company Name"])]
-    print(f"Found {len(todo_df)} new companies to process")
+    # Anti-join on main.py's case/whitespace-insensitive key instead of an isin mask
+    seen = pd.DataFrame({"_key": name_key(existing_df["Company Name"])}).drop_duplicates()
+    todo_df = new_df.assign(_key=name_key(new_df["Company Name"])).merge(seen, on="_key", how="left", indicator=True)
+    todo_df = todo_df[todo_df["_merge"] == "left_only"].drop(columns=["_key", "_merge"])
+    # Typographic variants of mapped companies ("Acme SAS" vs "ACME") are already in the mapping too
+    existing_norm = set(existing_df["Company Name"].map(normalize)) - {""}
+    variants = todo_df["Company Name"].map(normalize).isin(existing_norm)
+    if variants.any():
+        logger.info(f"♻️  Skipping {int(variants.sum())} variants of companies already in {EXISTING_FILE}")
+        todo_df = todo_df[~variants]
+    logger.info(f"Found {len(todo_df)} new companies to process")
     
     # ─── Checkpoint ───────────────────────────────────────────────────────────────
     processed_set = set()
     if os.path.exists(CHECKPOINT_FILE):
-        processed_set = {line.strip() for line in open(CHECKPOINT_FILE, encoding="utf-8")}
+        # one read + one decode, split in C; the file is closed straight away
+        with open(CHECKPOINT_FILE, "rb") as f:
+            processed_set = set(f.read().decode("utf-8").splitlines())
+        processed_set.discard("")
     
-    # Filter out already processed companies for efficiency
+    # Filter out already processed companies (and repeated names) before any work is queued
+    todo_df = todo_df.drop_duplicates(subset=["Company Name"])
     if processed_set:
         todo_df = todo_df[~todo_df["Company Name"].isin(processed_set)]
-        print(f"After filtering already processed: {len(todo_df)} companies remain")
+        logger.info(f"After filtering already processed: {len(todo_df)} companies remain")
     
     # ─── Parallel processing ──────────────────────────────────────────────────────
-    records = []
+    # Gen-AI startups are appended to OUTPUT_FILE as they are found (seeded from EXISTING_FILE)
+    output = ResultWriter(existing_file=EXISTING_FILE, path=OUTPUT_FILE)
     
-    # Convert DataFrame to list of dictionaries for parallel processing
-    companies_to_process = todo_df.to_dict('records')
+    # Rows are generated lazily, COMPANIES_PER_PROMPT at a time; only the groups being
+    # classified are held in memory
+    total = len(todo_df)
+    companies_to_process = (
+        {"Company Name": name, "Description": desc}
+        for name, desc in zip(todo_df["Company Name"], todo_df["Description"])
+    )
+    groups = iter(lambda: list(itertools.islice(companies_to_process, COMPANIES_PER_PROMPT)), [])
     
     # Start timer to track performance
     start_time = time.time()
     processed_count = 0
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_company = {executor.submit(process_company, company): company for company in companies_to_process}
+
+    def collect(record):
+        nonlocal processed_count
+        processed_count += 1
         
-        for future in concurrent.futures.as_completed(future_to_company):
-            company = future_to_company[future]
+        # Show progress and speed estimates
+        elapsed = time.time() - start_time
+        if processed_count > 0 and elapsed > 0:
+            rate = processed_count / elapsed
+            remaining = (total - processed_count) / rate if rate > 0 else 0
+            logger.info(f"Progress: {processed_count}/{total} ({rate:.2f}/min, ~{remaining/60:.1f} min remaining)")
+        
+        if record:
+            output.write(record)
+
+    # MAX_WORKERS coroutines pull groups from the shared generator
+    async def worker():
+        for group in groups:
             try:
-                record = future.result()
-                processed_count += 1
-                
-                # Show progress and speed estimates
-                elapsed = time.time() - start_time
-                if processed_count > 0 and elapsed > 0:
-                    rate = processed_count / elapsed
-                    remaining = (len(companies_to_process) - processed_count) / rate if rate > 0 else 0
-                    print(f"Progress: {processed_count}/{len(companies_to_process)} ({rate:.2f}/min, ~{remaining/60:.1f} min remaining)")
-                
-                if record:
-                    with output_lock:
-                        records.append(record)
-                        # Periodically save intermediate results
-                        if len(records) % 10 == 0:
-                            intermediate_df = pd.concat([existing_df, pd.DataFrame(records)], ignore_index=True)
-                            intermediate_df.to_csv(OUTPUT_FILE, index=False)
-                            print(f"✅  Intermediate save: {len(records)} Gen-AI startups → {OUTPUT_FILE}")
+                for record in await process_group(group):
+                    collect(record)
             except Exception as e:
-                print(f"❌  Error processing {company['Company Name']}: {e}")
+                logger.error(f"❌  Error processing {group[0]['Company Name']} …: {e}")
+
+    async def run_workers():
+        await asyncio.gather(*(worker() for _ in range(MAX_WORKERS)))
+
+    checkpoint_writer, error_writer = LineWriter(CHECKPOINT_FILE), LineWriter(ERROR_FILE)
+    try:
+        asyncio.run(run_workers())
+    finally:
+        checkpoint_writer.close()
+        error_writer.close()
+        output.close()
     
-    # ─── Save output ─────────────────────────────────────────────────────────────
-    updated_df = (
-        pd.concat([existing_df, pd.DataFrame(records)], ignore_index=True)
-        if records else existing_df
-    )
-    updated_df.to_csv(OUTPUT_FILE, index=False)
     total_time = time.time() - start_time
-    print(f"✅  Added {len(records)} Gen-AI startups → {OUTPUT_FILE}")
-    print(f"🔖  Progress checkpoint saved to {CHECKPOINT_FILE}")
-    print(f"⏱️  Total processing time: {total_time/60:.1f} minutes ({processed_count/total_time*60:.1f} companies/hour)")
+    logger.info(f"✅  Added {output.count} Gen-AI startups → {OUTPUT_FILE}")
+    logger.info(f"🔖  Progress checkpoint saved to {CHECKPOINT_FILE}")
+    logger.info(f"⏱️  Total processing time: {total_time/60:.1f} minutes ({processed_count/total_time*60:.1f} companies/hour)")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
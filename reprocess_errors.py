@@ -1,9 +1,15 @@
-import os, re, json, time
+import os, re, sys, time, random, asyncio, functools
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import pandas as pd
-import google.generativeai as genai
-from google.generativeai import types
-from google.generativeai.errors import ServerError, APIError
+from google import genai  # genai.Client / GenerateContentConfig live in the google-genai SDK
+from google.genai import types
+from google.genai.errors import APIError
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from main import CLASSIFY_MARKER, ResultWriter, build_group_user_turn, name_key, parse_group, server_retry_delay
+from parallel_processor import cached_result, store_result
 
 # ─── Load environment variables ────────────────────────────────────────────────
 load_dotenv()  # Load .env file
@@ -19,14 +25,20 @@ CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "checkpoint_processed.txt")
 ERROR_FILE = os.getenv("ERROR_FILE", "errors_unprocessed.txt")
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
-BATCH_SIZE = int(os.getenv("BATCH_SIZE", "15"))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "15"))  # Calls allowed per PAUSE_SECONDS window
 PAUSE_SECONDS = int(os.getenv("PAUSE_SECONDS", "60"))
+RETRY_DEADLINE = int(os.getenv("RETRY_DEADLINE", "300"))  # Seconds one call may spend retrying
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))  # Requests in flight at once
+COMPANIES_PER_PROMPT = max(1, int(os.getenv("COMPANIES_PER_PROMPT", "5")))  # Companies per model call
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "7200"))  # Seconds the static prompt stays cached; 0 disables
+
+SOURCE_COLUMNS = ["Company Name", "Description"]  # All the description lookup needs from each file
 
 # ─── Gemini client & search tool ──────────────────────────────────────────────
 genai_client = genai.Client(api_key=API_KEY)
 search_tool  = types.Tool(google_search=types.GoogleSearch())
 
-# ─── Prompt template (from main.py) ──────────────────────────────────────────
+# ─── Prompt template (from main.py, brace-safe) ──────────────────────────────
 PROMPT_TEMPLATE = """
 ╭────────────────────────  TASK  ────────────────────────╮
 │  Step 1. Show concise reasoning.                       │
@@ -37,10 +49,10 @@ PROMPT_TEMPLATE = """
 • **Startup** – Independent product company (own product, funding, team).
 • **Gen-AI Startup** – Core value prop uses LLMs, diffusion, or agentic Gen-AI.
 • **Layer** – Foundational / Infrastructure / Application.
-• **Category** – {Content, Customer Service, Cyber Security, Data, DefTech,
+• **Category** – {{Content, Customer Service, Cyber Security, Data, DefTech,
   Dev Tools, Development, EdTech, Enterprise Platforms, Gaming, HealthTech,
   Knowledge Workers, LegalTech, Marketing, Note Taker, RFP, Safety, SalesTech,
-  Science, HRTech, Consumer/Social}.
+  Science, HRTech, Consumer/Social}}.
 • **France link** – HQ, majority team, or founders clearly French.
 
 ────────────────────────  FORMAT  ───────────────────────
@@ -133,7 +145,7 @@ This is a  correct format:
 This is not a correct format :
 ### RESULT
 ```json
-{
+{{
   "is_startup": true,
   "is_startup_confidence": 80,
   "startup_rationale": "Website with product features",
@@ -146,156 +158,365 @@ This is not a correct format :
   "category_confidence": 60,
   "is_linked_to_france": false,
   "is_linked_to_france_confidence": 50
-}
+}}
 
 The JSON must be valid RFC-8259: use double quotes for every key and string, no trailing commas.
 
 Extra context : This batch of data comes from Crunchbase so the entries are very probably Startups.
 """
 
-# ─── Helper function to classify companies ─────────────────────────────────────
-def safe_classify_entity(name: str, description: str, max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
+# Everything before CLASSIFY is the same for every company: a group sends it once, and it can live in a context cache
+_static_part, _, _classify_tail = PROMPT_TEMPLATE.partition(CLASSIFY_MARKER)
+PROMPT_STATIC = _static_part.format()  # no placeholders up there: just un-escapes {{ }} once
+PROMPT_CLASSIFY = CLASSIFY_MARKER + _classify_tail
+
+# main.py's group block (build_group_user_turn) asks for a bare JSON array; grounded answers
+# come with reasoning, so the array has to be tagged
+PROMPT_GROUP_TAGS = """
+*Write a short REASONING section per company, then ONE RESULT block holding that single
+JSON array between <JSON> and </JSON> tags. Do not use markdown fences.*
+"""
+
+# ─── Context cache for the static prompt ──────────────────────────────────────
+_prompt_cache = {"name": None, "refresh_at": 0.0}
+_prompt_cache_lock = asyncio.Lock()
+
+async def prompt_cache_name() -> str | None:
     """
-    Returns (success_flag, result_dict).
-    success_flag = True  → parsed JSON returned
-    success_flag = False → nothing parsed; caller must NOT checkpoint this name
+    Name of a context cache holding PROMPT_STATIC and the search tool (billed once per TTL),
+    recreated shortly before the TTL runs out. None when caching is disabled or unavailable.
+    """
+    if PROMPT_CACHE_TTL <= 0:
+        return None
+    async with _prompt_cache_lock:      # one creation even when every worker asks at once
+        if time.time() >= _prompt_cache["refresh_at"]:
+            try:
+                cache = await genai_client.aio.caches.create(
+                    model=MODEL,
+                    config=types.CreateCachedContentConfig(
+                        display_name="genai-startup-reprocess-prompt",
+                        system_instruction=PROMPT_STATIC,
+                        tools=[search_tool],  # requests using a cache cannot add tools of their own
+                        ttl=f"{PROMPT_CACHE_TTL}s",
+                    ),
+                )
+                _prompt_cache.update(name=cache.name, refresh_at=time.time() + PROMPT_CACHE_TTL * 0.9)
+            except Exception as e:
+                print(f"⚠️  Context caching unavailable, sending the full prompt: {e}")
+                _prompt_cache.update(name=None, refresh_at=float("inf"))
+        return _prompt_cache["name"]
+
+
+def drop_prompt_cache():
+    """Forget the cache handle (e.g. it expired server-side); the next call recreates it."""
+    _prompt_cache.update(name=None, refresh_at=0.0)
+
+# ─── Helper functions to classify companies ───────────────────────────────────
+_JSON_RE = re.compile(r"<JSON>(.*?)</JSON>", re.S)
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+json_repairs = 0  # answers saved by repair_json in the current reprocess_errors() run
+
+def has_shape(value, expect: type) -> bool:
+    """`expect` dict: one classification object; list: a group answer, a non-empty array of objects."""
+    if expect is dict:
+        return isinstance(value, dict)
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def repair_json(text: str, expect: type = dict):
+    """
+    Lenient second pass for near-valid JSON: markdown fences dropped, trailing commas removed,
+    and an `expect`-shaped slice cut out of surrounding prose - only "{…}" for an object, only
+    "[…]" for an array of objects, so a citation like "[1]" is never taken for a result.
+    None when nothing of that shape parses.
     """
-    backoff = 2
+    fence = _FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1)
+    opener, closer = ("{", "}") if expect is dict else ("[", "]")
+    # The outermost slice first, then the latest ones (the RESULT block closes the answer);
+    # scans run backwards and stop after 20 hits, since answers can be long
+    backwards = range(len(text) - 1, -1, -1)
+    ends = list(islice((i for i in backwards if text[i] == closer), 20))
+    starts = list(islice((i for i in backwards if text[i] == opener), 20))
+    if not starts or not ends:
+        return None
+    candidates = [(text.find(opener), ends[0])] + [(start, end) for start in starts for end in ends if end > start]
+    for start, end in candidates:
+        try:
+            value = orjson.loads(_TRAILING_COMMA_RE.sub(r"\1", text[start:end + 1]))
+        except orjson.JSONDecodeError:
+            continue
+        if has_shape(value, expect):
+            return value
+    return None
+
+
+def extract_json(raw: str, expect: type = dict):
+    """
+    Decode the payload between the <JSON>…</JSON> tags of a model answer (repairing it if needed).
+    ValueError unless the result has the `expect` shape (see has_shape).
+    """
+    global json_repairs
+    m = _JSON_RE.search(raw)
+    if m:
+        try:
+            result = orjson.loads(m.group(1).strip())
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if not has_shape(result, expect):
+                raise ValueError(f"Expected a JSON {'object' if expect is dict else 'array of objects'}, "
+                                 f"got {type(result).__name__}")
+            return result
+    result = repair_json(m.group(1) if m else raw, expect)
+    if result is None:
+        raise ValueError("Unparseable <JSON> block." if m else "No <JSON> block found.")
+    json_repairs += 1
+    print(f"🩹 Recovered malformed JSON ({'inside' if m else 'without'} <JSON> tags)")
+    return result
+
+
+RETRIABLE_CODES = {429, 500, 502, 503, 504}  # quota + transient server errors
+
+def retry_after_seconds(e: APIError) -> float | None:
+    """Server-suggested wait of a google-genai error (RetryInfo / Retry-After); None when absent."""
+    error = e.details.get("error", {}) if isinstance(e.details, dict) else {}
+    return server_retry_delay(getattr(getattr(e, "response", None), "headers", None), error)
+
+
+def backoff_seconds(attempt: int, e: APIError) -> float:
+    """Full-jitter exponential backoff (capped at 60s), on top of any server-suggested wait."""
+    return random.uniform(0, min(60, 2 ** attempt)) + (retry_after_seconds(e) or 0)
+
+
+async def generate(user_turn: str, parse, label: str, limiter: AsyncLimiter,
+                   max_retries: int = MAX_RETRIES) -> tuple[bool, object]:
+    """
+    Send `user_turn` after PROMPT_STATIC (from the context cache when there is one, else
+    inline) with the search tool and decode the answer with `parse`.
+    Returns (True, parsed) or (False, {}) once retries are exhausted.
+    """
+    deadline = time.monotonic() + RETRY_DEADLINE
     for attempt in range(1, max_retries + 1):
+        cache_name = await prompt_cache_name()
         try:
-            prompt = (
-                PROMPT_TEMPLATE
-                + f"\n\nNow classify the following company:\n"
-                + f"Name: {name}\n"
-                + f"Description (ID-check only – do NOT rely on it): {description}\n"
-            )
-            resp = genai_client.models.generate_content(
+            await limiter.acquire()     # BATCH_SIZE calls per PAUSE_SECONDS, spread evenly
+            if cache_name:
+                contents, config = user_turn, types.GenerateContentConfig(cached_content=cache_name)
+            else:
+                contents, config = PROMPT_STATIC + user_turn, types.GenerateContentConfig(tools=[search_tool])
+            resp = await genai_client.aio.models.generate_content(
                 model=MODEL,
-                contents=prompt,
-                config=types.GenerateContentConfig(tools=[search_tool]),
+                contents=contents,
+                config=config,
             )
-            raw = resp.text.strip()
-
-            m = re.search(r"<JSON>(.*?)</JSON>", raw, re.S)
-            if not m:
-                raise ValueError("No <JSON> block found.")
-            json_text = m.group(1).strip()
-            result = json.loads(json_text)
-            return True, result           # ← success
-        except ServerError as e:          # transient 5xx
-            code = getattr(e, "code", 503)
-            if attempt < max_retries and code in (500, 502, 503, 504):
-                wait = backoff * attempt
-                print(f"[Retry {attempt}/{max_retries}] {code} – wait {wait}s")
-                time.sleep(wait)
+            raw = (resp.text or "").strip()  # text is None when the candidate was blocked or empty
+            if not raw:
+                raise ValueError("Response has no text (blocked or empty candidate)")
+            return True, parse(raw)       # ← success
+        except ValueError as e:          # includes orjson.JSONDecodeError
+            print(f"❌  Parse error for {label}: {e}")
+        except APIError as e:            # ServerError (5xx) and ClientError (4xx, incl. 429)
+            if cache_name and attempt < max_retries and "cache" in str(e).lower():
+                print(f"♻️  Context cache rejected ({e.code}), recreating it")
+                if _prompt_cache["name"] == cache_name:
+                    drop_prompt_cache()
                 continue
-            print(f"❌  ServerError {code} for {name}")
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"❌  Parse error for {name}: {e}")
-        except APIError as e:
-            print(f"❌  API error for {name}: {e}")
+            if attempt < max_retries and e.code in RETRIABLE_CODES:
+                wait = backoff_seconds(attempt, e)
+                if time.monotonic() + wait < deadline:
+                    print(f"[Retry {attempt}/{max_retries}] {e.code} – wait {wait:.1f}s")
+                    await asyncio.sleep(wait)
+                    continue
+                print(f"⏱️  Retry deadline of {RETRY_DEADLINE}s reached for {label}")
+            print(f"❌  API error {e.code} for {label}: {e}")
         break                            # → exit retry loop
 
     # after all retries failed
     return False, {}                    # caller will log + retry later
 
+
+async def safe_classify_entity(name: str, description: str, limiter: AsyncLimiter,
+                               max_retries: int = MAX_RETRIES) -> tuple[bool, dict]:
+    """
+    Returns (success_flag, result_dict).
+    success_flag = True  → parsed JSON returned
+    success_flag = False → nothing parsed; caller must NOT checkpoint this name
+    """
+    cached = cached_result(name, description)
+    if cached is not None:
+        return True, cached
+
+    user_turn = PROMPT_CLASSIFY.format(name=name, description=description)
+    success, result = await generate(user_turn, extract_json, name, limiter, max_retries)
+    if success and not isinstance(result, dict):
+        print(f"❌  Parse error for {name}: expected a JSON object, got {type(result).__name__}")
+        return False, {}                # never cached nor recorded: stays in the error file
+    if success:
+        store_result(name, description, result)
+    return success, result
+
+
+async def classify_batch(names_descs: list[tuple[str, str]], limiter: AsyncLimiter,
+                         max_retries: int = MAX_RETRIES) -> dict[str, dict]:
+    """
+    Classify several companies with a single call: the shared template once, then a
+    keyed list of companies. Returns {name: result} for every company that was cached or
+    covered by the answer; callers fall back to safe_classify_entity for the rest.
+    """
+    results, to_send = {}, []
+    for name, desc in names_descs:
+        cached = cached_result(name, desc)
+        if cached is not None:
+            results[name] = cached
+        else:
+            to_send.append((name, desc))
+    if len(to_send) < 2:
+        return results                  # a lone company goes through safe_classify_entity
+
+    user_turn = build_group_user_turn(to_send) + PROMPT_GROUP_TAGS
+    label = f"group of {len(to_send)} ({to_send[0][0]}, …)"
+    decode = functools.partial(extract_json, expect=list)
+    _, parsed = await generate(user_turn, lambda raw: parse_group(raw, to_send, decode), label, limiter, max_retries)
+    for name, desc in to_send:
+        if name in parsed:
+            store_result(name, desc, parsed[name])
+            results[name] = parsed[name]
+    return results
+
+# ─── Helper functions to load source files ────────────────────────────────────
+def read_excel_source(path: str) -> pd.DataFrame:
+    # Name + description are the first two columns; calamine parses the workbook in Rust
+    return pd.read_excel(
+        path, engine="calamine", usecols=[0, 1], names=["Company Name", "Description"], dtype="string"
+    )
+
+
+def read_csv_source(path: str) -> pd.DataFrame:
+    # The header decides: pyarrow rejects usecols naming a missing column (and callable usecols)
+    columns = set(pd.read_csv(path, nrows=0).columns)
+    if "Company Name" not in columns:
+        raise ValueError("no 'Company Name' column")
+    if "Description" not in columns:
+        # Still a usable source: its names get reprocessed with an empty description
+        print(f"ℹ️ {path} has no Description column, names only")
+        df = pd.read_csv(path, engine="pyarrow", usecols=["Company Name"], dtype="string")
+        return df.assign(Description=pd.Series(pd.NA, index=df.index, dtype="string"))
+    return pd.read_csv(path, engine="pyarrow", usecols=SOURCE_COLUMNS, dtype="string")
+
+
+def safe_read(reader, label: str, path: str, optional: bool = False) -> pd.DataFrame | None:
+    """
+    `reader(path)`, or None with a warning when it fails - one bad source never stops the others.
+    Readers return None themselves for a file that is fine but has nothing to contribute.
+    """
+    if optional and not os.path.exists(path):
+        return None
+    try:
+        return reader(path)
+    except Exception as e:
+        print(f"Warning: Could not load {label} {path}: {e}")
+        return None
+
+
 def reprocess_errors(error_file=ERROR_FILE, max_per_run=50):
     """Process previously failed items from the error file."""
+    global json_repairs
+    json_repairs = 0                    # counted per run, not per process
     if not os.path.exists(error_file):
         print(f"Error file {error_file} not found.")
         return
     
     print(f"Starting reprocessing from {error_file}...")
     
-    # Read and deduplicate error file
+    # Read and deduplicate error file - by name_key, keeping each company's first spelling
+    # for prompts, logs and the CSV
+    failed = {}
     with open(error_file, "r", encoding="utf-8") as f:
-        failed_names = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+        for line in f:
+            if name := line.strip():
+                failed.setdefault(sys.intern(name_key(name)), name)
     
-    print(f"Found {len(failed_names)} unique failed items to reprocess.")
+    print(f"Found {len(failed)} unique failed items to reprocess.")
     
-    # Limit number of reprocessed items per run
-    to_process = failed_names[:max_per_run]
     successful = []
     still_failed = []
     
-    # Load processed set to avoid reprocessing
+    # Load processed set to avoid reprocessing - only names from the error file are kept,
+    # so memory follows the error file however large the checkpoint grows
     processed_set = set()
     if os.path.exists(CHECKPOINT_FILE):
         with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
-            processed_set = {line.strip() for line in f if line.strip()}
+            # Only the hits are interned: the rest of the checkpoint is dropped line by line
+            processed_set = {sys.intern(key) for key in map(name_key, f) if key in failed}
     
-    # Filter out already processed items
-    to_process = [name for name in to_process if name not in processed_set]
+    # Skip already processed items first, then limit the run, so stale entries never eat into max_per_run
+    to_process = list(islice((name for key, name in failed.items() if key not in processed_set), max_per_run))
     if not to_process:
         print("All items in error file have already been processed. Nothing to do.")
         return []
     
     print(f"Will attempt to reprocess {len(to_process)} items.")
     
-    # Get company details from source files
-    source_dfs = []
-    
-    # Try to load Excel file
-    try:
-        excel_df = pd.read_excel(NEW_FILE)
-        if "Company Name" not in excel_df.columns and excel_df.shape[1] >= 2:
-            excel_df.columns = ["Company Name", "Description"] + list(excel_df.columns[2:])
-        source_dfs.append(excel_df)
-    except Exception as e:
-        print(f"Warning: Could not load Excel file {NEW_FILE}: {e}")
-    
-    # Try to load CSV file
-    try:
-        csv_df = pd.read_csv(EXISTING_FILE)
-        source_dfs.append(csv_df)
-    except Exception as e:
-        print(f"Warning: Could not load CSV file {EXISTING_FILE}: {e}")
-    
-    # Try to load the output file as well for comprehensive data
-    try:
-        if os.path.exists(OUTPUT_FILE):
-            output_df = pd.read_csv(OUTPUT_FILE)
-            source_dfs.append(output_df)
-    except Exception as e:
-        print(f"Warning: Could not load output file {OUTPUT_FILE}: {e}")
+    # Get company details from source files - only name + description are read.
+    # The reads are independent and calamine/pyarrow parse outside the GIL, so they run
+    # side by side; map() keeps the source order that decides which description wins.
+    sources = [
+        (read_excel_source, "Excel file", NEW_FILE, False),
+        (read_csv_source, "CSV file", EXISTING_FILE, False),
+        (read_csv_source, "output file", OUTPUT_FILE, True),  # for comprehensive data
+    ]
+    with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+        source_dfs = [df for df in pool.map(lambda source: safe_read(*source), sources) if df is not None]
     
     if not source_dfs:
         print("Error: Could not load any source data files. Aborting.")
         return []
     
-    # Combine all data sources
-    combined_df = pd.concat(source_dfs, ignore_index=True)
+    # Combine all data sources, keeping only the rows of names being reprocessed
+    process_keys = [name_key(name) for name in to_process]
+    trimmed_dfs = []
+    for df in source_dfs:
+        keys = name_key(df["Company Name"])
+        trimmed_dfs.append(df[keys.isin(process_keys)].assign(_key=keys))
+    combined_df = pd.concat(trimmed_dfs, ignore_index=True)
     
-    # Create a map for faster lookups
-    company_map = {}
+    # Name → description lookup kept in pandas; later sources win, as in a dict built in order
+    desc_series = pd.Series(dtype="string")
     if "Description" in combined_df.columns:
-        company_map = {
-            str(name): str(desc) for name, desc in 
-            zip(combined_df["Company Name"], combined_df["Description"])
-            if not pd.isna(name) and not pd.isna(desc)
-        }
+        desc_series = (
+            combined_df.dropna(subset=["_key", "Description"])
+            .astype({"Description": "string"})
+            .drop_duplicates("_key", keep="last")
+            .set_index("_key")["Description"]
+        )
+    # Description for every name to reprocess, or "" when no source has one
+    descs = desc_series.reindex(process_keys).fillna("").tolist()
+    
+    # Gen-AI startups are appended to OUTPUT_FILE as they are found, so an interrupted run keeps them
+    try:
+        output = ResultWriter(existing_file=EXISTING_FILE, path=OUTPUT_FILE)
+    except Exception as e:
+        print(f"Error opening output file {OUTPUT_FILE}: {e}")
+        return []
     
     records = []
-    batch_counter = 0
+    # Rate limit (calls per window) and concurrency (calls in flight) are capped separately
+    limiter = AsyncLimiter(BATCH_SIZE, PAUSE_SECONDS)
+    sem = asyncio.Semaphore(MAX_WORKERS)
     
-    for i, name in enumerate(to_process):
-        print(f"Processing {i+1}/{len(to_process)}: {name}")
-        
-        # Get description from data or use empty string
-        desc = company_map.get(name, "")
-        
-        if not desc:
-            print(f"Warning: No description found for {name}")
-        
-        success, result = safe_classify_entity(name, desc)
-        
+    def record(name, desc, success, result):
+        # No lock needed: workers share one thread and only switch at an await
         if success:
             successful.append(name)
             print(f"✅ Successfully classified {name}")
             
             # Add to results if it's a Gen-AI startup
             if result.get("is_startup") and result.get("is_gen_ai_startup"):
-                records.append({
+                row = {
                     "Company Name": name,
                     "Description": desc,
                     "Layer": result.get("layer"),
@@ -306,48 +527,84 @@ def reprocess_errors(error_file=ERROR_FILE, max_per_run=50):
                     "GenAI Confidence": result.get("is_gen_ai_startup_confidence"),
                     "Linked to France": result.get("is_linked_to_france"),
                     "France Confidence": result.get("is_linked_to_france_confidence"),
-                })
+                }
+                records.append(row)
+                output.write(row)
                 print(f"📊 Added to mapping: {name}")
             else:
                 print(f"ℹ️ Not a Gen-AI startup: {name}")
             
-            # Checkpoint successful reprocessing
-            with open(CHECKPOINT_FILE, "a", encoding="utf-8") as f:
-                f.write(name + "\n")
+            # Checkpoint successful reprocessing (flushed once per group, see worker)
+            ckpt.write(name + "\n")
         else:
             still_failed.append(name)
             print(f"❌ Failed to classify {name}")
-        
-        # Rate limiting
-        batch_counter += 1
-        if batch_counter >= BATCH_SIZE:
-            print(f"⏸️  Pausing {PAUSE_SECONDS}s to respect rate limits...")
-            time.sleep(PAUSE_SECONDS)
-            batch_counter = 0
     
-    # Update output file with newly processed items
+    async def worker(group):
+        async with sem:
+            rows = []
+            for i, (name, desc) in group:
+                print(f"Processing {i+1}/{len(to_process)}: {name}")
+                
+                if not desc:
+                    print(f"Warning: No description found for {name}")
+                rows.append((name, desc))
+            
+            # One call for the whole group (cached names skip it); the rest go out alone
+            recorded = set()
+            try:
+                results = await classify_batch(rows, limiter)
+                for name, desc in rows:
+                    if name in results:
+                        success, result = True, results[name]
+                    else:
+                        if len(rows) > 1:
+                            print(f"↩️ {name} not covered by the group answer, classifying alone")
+                        success, result = await safe_classify_entity(name, desc, limiter)
+                    recorded.add(name)
+                    record(name, desc, success, result)
+            except Exception as e:      # one bad answer must not abort the whole run
+                print(f"❌ Unexpected error for {rows[0][0]}'s group: {e!r}")
+                for name, desc in rows:
+                    if name not in recorded:
+                        record(name, desc, False, {})
+            ckpt.flush()
+    
+    async def run_all():
+        pending = enumerate(zip(to_process, descs))
+        groups = iter(lambda: list(islice(pending, COMPANIES_PER_PROMPT)), [])
+        await asyncio.gather(*(worker(group) for group in groups))
+    
+    # One handle for the whole run instead of an open/close per checkpointed name
+    try:
+        with open(CHECKPOINT_FILE, "a", encoding="utf-8") as ckpt:
+            asyncio.run(run_all())
+    finally:
+        output.close()
+    
+    # Names already in the mapping were appended again; keep their first row.
+    # Only the name column is read unless there actually is a duplicate to drop.
     if records:
         try:
-            existing_df = pd.read_csv(OUTPUT_FILE)
-            updated_df = pd.concat([existing_df, pd.DataFrame(records)], ignore_index=True)
-            # Remove duplicates if any
-            updated_df = updated_df.drop_duplicates(subset=["Company Name"], keep="first")
-            updated_df.to_csv(OUTPUT_FILE, index=False)
+            names = pd.read_csv(OUTPUT_FILE, engine="pyarrow", usecols=["Company Name"])["Company Name"]
+            if names.duplicated().any():
+                pd.read_csv(OUTPUT_FILE).drop_duplicates(subset=["Company Name"], keep="first").to_csv(
+                    OUTPUT_FILE, index=False
+                )
             print(f"Updated {OUTPUT_FILE} with {len(records)} new Gen-AI startups")
         except Exception as e:
-            print(f"Error updating output file: {e}")
-            # Save to a backup file instead
-            pd.DataFrame(records).to_csv("reprocessed_results.csv", index=False)
-            print(f"Saved results to reprocessed_results.csv instead")
+            print(f"Error deduplicating output file: {e}")
     
-    # Rewrite error file with remaining failures
-    remaining_failures = list(set(failed_names) - set(successful))
+    # Rewrite error file with remaining failures, in their original (FIFO) order
+    succeeded = {name_key(name) for name in successful}
+    remaining_failures = [name for key, name in failed.items() if key not in succeeded]
     with open(error_file, "w", encoding="utf-8") as f:
-        for name in remaining_failures:
-            f.write(name + "\n")
+        f.write("".join(name + "\n" for name in remaining_failures))
     
     print(f"Reprocessing complete: {len(successful)} succeeded, {len(still_failed)} still failed")
     print(f"Added {len(records)} new Gen-AI startups to the mapping")
+    if json_repairs:
+        print(f"🩹 {json_repairs} answers were recovered by the lenient JSON repair")
     return records
 
 if __name__ == "__main__":